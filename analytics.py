@@ -0,0 +1,308 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import date, datetime
+import numpy as np
+from sqlalchemy import text
+import db_helper
+import menu_cache
+
+# Seconds between catch-up reads of orders and reviews written by other workers
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "30"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "50000"))
+# Orders recorded on this worker since the last refresh before it catches up
+# on its own, which trims their ids, instead of waiting for an admin request
+ANALYTICS_MAX_RECORDED = int(os.getenv("ANALYTICS_MAX_RECORDED", "10000"))
+
+# Only rows past the last id already read are fetched, so after the first
+# load each catch-up touches the new orders alone
+SELECT_NEW_ORDER_LINES = text(
+    """
+    SELECT o.id, o.created_at, oi.food_item_id, oi.quantity,
+           COALESCE(oi.unit_price, f.price, 0)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    LEFT JOIN food_items f ON f.id = oi.food_item_id
+    WHERE o.id > :after
+    ORDER BY o.id
+    """
+)
+# Reviews rate a whole order, each item of the order gets the rating
+SELECT_NEW_REVIEWS = text(
+    """
+    SELECT r.id, oi.food_item_id, r.rating
+    FROM reviews r
+    JOIN order_items oi ON oi.order_id = r.order_id
+    WHERE r.id > :after
+    ORDER BY r.id
+    """
+)
+
+
+def _day(value) -> int:
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()
+    # SQLite hands DATETIME columns of raw SQL back as ISO strings
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+# Growable NumPy column, appended to in amortized O(1)
+class _Column:
+    def __init__(self, dtype):
+        self._data = np.empty(1024, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self._data):
+            grown = np.empty(max(needed, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[: self.size] = self._data[: self.size]
+            self._data = grown
+        self._data[self.size : needed] = values
+        self.size = needed
+
+    def view(self):
+        return self._data[: self.size]
+
+    def reorder(self, order):
+        self._data[: self.size] = self._data[: self.size][order]
+
+
+# Columnar read model with one row per (day, food item) holding the quantity
+# sold and revenue, kept sorted by day: a date range is two binary searches and
+# the aggregates are bincounts over the slice, however many order lines the
+# rows summarize
+class AnalyticsModel:
+    def __init__(
+        self,
+        refresh_seconds=ANALYTICS_REFRESH_SECONDS,
+        max_recorded=ANALYTICS_MAX_RECORDED,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.max_recorded = max_recorded
+        self._days = _Column(np.int32)
+        self._items = _Column(np.int32)
+        self._quantities = _Column(np.int64)
+        self._revenue = _Column(np.float64)
+        # (day, food_item_id) -> row, for folding new lines into existing rows
+        self._rows = {}
+        self._sorted = True
+        self._orders_by_day = Counter()
+        self._last_order_id = 0
+        self._last_review_id = 0
+        # Ids of orders this worker recorded past the watermark, skipped when
+        # the catch-up read reaches them
+        self._recorded = set()
+        self._rating_sums = {}
+        self._rating_counts = {}
+        self._refreshed_at = None
+        self._refresh_lock = None
+        self._catch_up_task = None
+
+    def __len__(self):
+        return self._days.size
+
+    # Adds {(day, food_item_id): [quantity, revenue]} to the read model
+    def _add_lines(self, lines: dict):
+        quantities = self._quantities.view()
+        revenue = self._revenue.view()
+        new_keys = []
+        for key, (quantity, amount) in lines.items():
+            row = self._rows.get(key)
+            if row is None:
+                new_keys.append(key)
+            else:
+                quantities[row] += quantity
+                revenue[row] += amount
+        if not new_keys:
+            return
+        new_keys.sort()
+        if self._days.size and new_keys[0][0] < self._days.view()[-1]:
+            self._sorted = False
+        first_row = self._days.size
+        self._days.extend([key[0] for key in new_keys])
+        self._items.extend([key[1] for key in new_keys])
+        self._quantities.extend([lines[key][0] for key in new_keys])
+        self._revenue.extend([lines[key][1] for key in new_keys])
+        for row, key in enumerate(new_keys, first_row):
+            self._rows[key] = row
+
+    # Called when an order completes on this worker
+    def record_order(self, order_id: int, order_items: dict, lookup):
+        day = date.today().toordinal()
+        lines = {}
+        for food_item, quantity in order_items.items():
+            row = lookup(food_item)
+            if row is None:
+                continue
+            line = lines.setdefault((day, row.id), [0, 0.0])
+            line[0] += int(quantity)
+            line[1] += row.price * int(quantity)
+        self._add_lines(lines)
+        self._orders_by_day[day] += 1
+        if order_id > self._last_order_id:
+            self._recorded.add(order_id)
+            if len(self._recorded) > self.max_recorded and self._catch_up_task is None:
+                self._catch_up_task = asyncio.get_running_loop().create_task(
+                    self._catch_up()
+                )
+
+    async def _catch_up(self):
+        try:
+            await self.refresh(force=True)
+        except Exception as e:
+            print(f"An error occurred while refreshing analytics: {e}")
+        finally:
+            self._catch_up_task = None
+
+    def _append_order_rows(self, rows):
+        lines = {}
+        last_order_id = self._last_order_id
+        for order_id, created_at, food_item_id, quantity, unit_price in rows:
+            if order_id in self._recorded:
+                continue
+            day = _day(created_at)
+            if order_id != last_order_id:
+                self._orders_by_day[day] += 1
+                last_order_id = order_id
+            line = lines.setdefault((day, food_item_id), [0, 0.0])
+            line[0] += quantity
+            line[1] += unit_price * quantity
+        self._add_lines(lines)
+        if rows:
+            self._last_order_id = max(self._last_order_id, rows[-1][0])
+
+    def _append_review_rows(self, rows):
+        for review_id, food_item_id, rating in rows:
+            self._rating_sums[food_item_id] = (
+                self._rating_sums.get(food_item_id, 0) + rating
+            )
+            self._rating_counts[food_item_id] = (
+                self._rating_counts.get(food_item_id, 0) + 1
+            )
+        if rows:
+            self._last_review_id = rows[-1][0]
+
+    # Reads orders and reviews added since the last refresh (everything on the
+    # first call), at most once per refresh_seconds
+    async def refresh(self, force=False):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if (
+                not force
+                and self._refreshed_at is not None
+                and time.monotonic() - self._refreshed_at < self.refresh_seconds
+            ):
+                return
+            async with db_helper.get_async_engine().connect() as connection:
+                for statement, after, append in (
+                    (SELECT_NEW_ORDER_LINES, "_last_order_id", self._append_order_rows),
+                    (SELECT_NEW_REVIEWS, "_last_review_id", self._append_review_rows),
+                ):
+                    result = await connection.stream(
+                        statement.execution_options(yield_per=ANALYTICS_BATCH_SIZE),
+                        {"after": getattr(self, after)},
+                    )
+                    async for rows in result.partitions():
+                        append(rows)
+            self._recorded = {i for i in self._recorded if i > self._last_order_id}
+            self._refreshed_at = time.monotonic()
+
+    def _ensure_sorted(self):
+        if self._sorted:
+            return
+        order = np.lexsort((self._items.view(), self._days.view()))
+        for column in (self._days, self._items, self._quantities, self._revenue):
+            column.reorder(order)
+        self._rows = {
+            key: row
+            for row, key in enumerate(
+                zip(self._days.view().tolist(), self._items.view().tolist())
+            )
+        }
+        self._sorted = True
+
+    def _range(self, start: int, end: int) -> slice:
+        self._ensure_sorted()
+        days = self._days.view()
+        # Bounds of the column's dtype, or NumPy copies the column to compare
+        return slice(
+            np.searchsorted(days, np.int32(start), "left"),
+            np.searchsorted(days, np.int32(end), "right"),
+        )
+
+    def revenue_by_day(self, start: date, end: date) -> list:
+        first, last = start.toordinal(), end.toordinal()
+        rows = self._range(first, last)
+        revenue = np.bincount(
+            self._days.view()[rows] - first,
+            weights=self._revenue.view()[rows],
+            minlength=last - first + 1,
+        )
+        return [
+            {
+                "date": date.fromordinal(first + offset).isoformat(),
+                "revenue": round(float(revenue[offset]), 2),
+                "orders": self._orders_by_day.get(first + offset, 0),
+            }
+            for offset in range(last - first + 1)
+        ]
+
+    def average_rating(self, food_item_id: int):
+        count = self._rating_counts.get(food_item_id)
+        if not count:
+            return None
+        return round(self._rating_sums[food_item_id] / count, 2)
+
+    def top_items(self, start: date, end: date, limit=10) -> list:
+        rows = self._range(start.toordinal(), end.toordinal())
+        items = self._items.view()[rows]
+        if not len(items):
+            return []
+        quantities = np.bincount(items, weights=self._quantities.view()[rows])
+        revenue = np.bincount(items, weights=self._revenue.view()[rows])
+        sold = np.flatnonzero(quantities)
+        if len(sold) > limit:
+            sold = sold[np.argpartition(-quantities[sold], limit - 1)[:limit]]
+        sold = sold[np.lexsort((sold, -quantities[sold]))]
+        top = []
+        for food_item_id in sold.tolist():
+            item = menu_cache.catalog.get(food_item_id)
+            top.append(
+                {
+                    "food_item_id": food_item_id,
+                    "name": item.name if item is not None else None,
+                    "quantity": int(quantities[food_item_id]),
+                    "revenue": round(float(revenue[food_item_id]), 2),
+                    "average_rating": self.average_rating(food_item_id),
+                }
+            )
+        return top
+
+    def ratings(self) -> list:
+        return [
+            {
+                "food_item_id": food_item_id,
+                "average_rating": self.average_rating(food_item_id),
+                "reviews": count,
+            }
+            for food_item_id, count in sorted(self._rating_counts.items())
+        ]
+
+    def summary(self, start: date, end: date, limit=10) -> dict:
+        by_day = self.revenue_by_day(start, end)
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "revenue": round(sum(day["revenue"] for day in by_day), 2),
+            "orders": sum(day["orders"] for day in by_day),
+            "revenue_by_day": by_day,
+            "top_items": self.top_items(start, end, limit),
+            "ratings": self.ratings(),
+        }
+
+
+model = AnalyticsModel()
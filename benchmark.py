@@ -0,0 +1,858 @@
+import argparse
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Load generator for the webhook and the main pages. By default the app runs
+# in-process against a throwaway SQLite database; --database-url points it at
+# a local MySQL (e.g. in a container) instead, never at production.
+
+ORDER_ID_PATTERN = re.compile(r"order id is: (\d+)")
+# Status checks per order in --mode tracking, as a customer polling it
+TRACKING_POLLS = 5
+BENCHMARK_USER = ("bench", "bench-password")
+# Accounts a --mode login storm spreads its wrong passwords over, so the
+# per-username rate limit still lets LOGIN_MAX_FAILURES verifies each through
+LOGIN_STORM_USERS = 10
+
+# SQL statements issued while handling the current request
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+# Seconds spent rendering templates for the current request
+_request_render = contextvars.ContextVar("request_render", default=None)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        # name -> list of (seconds, queries or None, ok, render seconds or None)
+        self.samples = {}
+        # Prepended to endpoint names, to tell apart passes of one run
+        self.prefix = ""
+
+    async def request(self, client, name, method, url, count_queries, **kwargs):
+        name = self.prefix + name
+        queries = [0] if count_queries else None
+        render = [0.0] if count_queries else None
+        token = _request_queries.set(queries)
+        render_token = _request_render.set(render)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            _request_render.reset(render_token)
+        self.samples.setdefault(name, []).append(
+            (
+                elapsed,
+                queries[0] if queries else queries,
+                ok,
+                render[0] if render else render,
+            )
+        )
+        return response
+
+    def report(self, wall_time: float) -> dict:
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = [sample[0] * 1000 for sample in samples]
+            counted = [sample[1] for sample in samples if sample[1] is not None]
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": sum(1 for sample in samples if not sample[2]),
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p95_ms": round(percentile(latencies, 0.95), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "queries_per_request": (
+                    round(sum(counted) / len(counted), 3) if counted else None
+                ),
+                "render_ms_per_request": render_ms_per_request(samples),
+            }
+        total = sum(endpoint["requests"] for endpoint in endpoints.values())
+        return {
+            "requests": total,
+            "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+            "wall_time_s": round(wall_time, 3),
+            "throughput_rps": round(total / wall_time, 1) if wall_time else 0.0,
+            "endpoints": endpoints,
+        }
+
+    # Throughput and latency over every endpoint whose name starts with prefix
+    def totals(self, wall_time: float, prefix="") -> dict:
+        samples = [
+            sample
+            for name, endpoint_samples in self.samples.items()
+            if name.startswith(prefix)
+            for sample in endpoint_samples
+        ]
+        latencies = [sample[0] * 1000 for sample in samples]
+        counted = [sample[1] for sample in samples if sample[1] is not None]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if not sample[2]),
+            "wall_time_s": round(wall_time, 3),
+            "throughput_rps": round(len(samples) / wall_time, 1) if wall_time else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "queries_per_1k_requests": (
+                round(sum(counted) * 1000 / len(counted), 1) if counted else None
+            ),
+            "render_ms_per_request": render_ms_per_request(samples),
+        }
+
+
+def render_ms_per_request(samples: list):
+    rendered = [sample[3] for sample in samples if sample[3] is not None]
+    return round(sum(rendered) * 1000 / len(rendered), 3) if rendered else None
+
+
+def webhook_body(intent: str, parameters: dict, session_id: str) -> dict:
+    return {
+        "responseId": os.urandom(8).hex(),
+        "queryResult": {
+            "intent": {"displayName": intent},
+            "parameters": parameters,
+            "outputContexts": [
+                {
+                    "name": f"projects/chat-cuisine/agent/sessions/{session_id}"
+                    "/contexts/ongoing-order"
+                }
+            ],
+        },
+    }
+
+
+# One Dialogflow conversation: add twice, remove one item, complete, track
+async def replay_session(client, recorder, session_id, menu, count_queries):
+    first, second = random.sample(menu, 2)
+    steps = [
+        (
+            "webhook:add",
+            "order.add - context: ongoing-order",
+            {"food-item": [first, second], "number": [2, 1]},
+        ),
+        (
+            "webhook:add",
+            "order.add - context: ongoing-order",
+            {"food-item": [random.choice(menu)], "number": [1]},
+        ),
+        (
+            "webhook:remove",
+            "order.remove - context: ongoing-order",
+            {"food-item": [second]},
+        ),
+        ("webhook:complete", "order.complete - context: ongoing-order", {}),
+    ]
+    order_id = None
+    for name, intent, parameters in steps:
+        response = await recorder.request(
+            client,
+            name,
+            "POST",
+            "/webhook",
+            count_queries,
+            json=webhook_body(intent, parameters, session_id),
+        )
+        if response is not None and name == "webhook:complete":
+            match = ORDER_ID_PATTERN.search(response.text)
+            order_id = int(match.group(1)) if match else None
+    if order_id is not None:
+        await recorder.request(
+            client,
+            "webhook:track",
+            "POST",
+            "/webhook",
+            count_queries,
+            json=webhook_body(
+                "track.order - context: ongoing-tracking",
+                {"number": order_id},
+                session_id,
+            ),
+        )
+
+
+# A customer asking for an order's status TRACKING_POLLS times in a row
+async def track_polls(client, recorder, order_id, count_queries):
+    for _ in range(TRACKING_POLLS):
+        await recorder.request(
+            client,
+            "webhook:track",
+            "POST",
+            "/webhook",
+            count_queries,
+            json=webhook_body(
+                "track.order - context: ongoing-tracking",
+                {"number": order_id},
+                f"tracking-{order_id}",
+            ),
+        )
+
+
+# Every status read goes to the database, as before the order-status cache
+def disable_status_cache():
+    import order_status
+
+    order_status.cache.ttl = 0
+
+
+# Webhook parsing and intent routing alone: an unknown intent (no handler
+# work) and an add to a cart (in-memory session store, no DB writes)
+async def dispatch_round(client, recorder, session_id, menu, count_queries):
+    for name, intent, parameters in (
+        ("dispatch:fallback", "smalltalk.greetings", {}),
+        (
+            "dispatch:add",
+            "order.add - context: ongoing-order",
+            {"food-item": [random.choice(menu)], "number": [1]},
+        ),
+    ):
+        await recorder.request(
+            client,
+            name,
+            "POST",
+            "/webhook",
+            count_queries,
+            json=webhook_body(intent, parameters, session_id),
+        )
+
+
+# Menu API reads against the seeded menu: the first and a deep keyset page,
+# filters, and prefix and typo-tolerant name search
+async def menu_queries(client, recorder, menu, count_queries):
+    name = random.choice(menu)
+    for label, params in (
+        ("api:first-page", {}),
+        ("api:deep-page", {"after": random.randint(1, len(menu))}),
+        ("api:filtered", {"available": "true", "min_price": 10, "max_price": 12}),
+        ("api:prefix", {"q": name.split()[-1]}),
+        ("api:fuzzy", {"q": name.lower().replace("dish", "dsh"), "fuzzy": "true"}),
+    ):
+        await recorder.request(
+            client, label, "GET", "/api/food-items", count_queries, params=params
+        )
+
+
+# Megabytes the loaded menu catalog and its search indexes hold on to
+def measure_catalog_memory() -> float:
+    import tracemalloc
+    import db_helper
+    import menu_cache
+
+    # Engine setup is not part of the catalog
+    db_helper.get_engine()
+    tracemalloc.start()
+    try:
+        menu_cache.catalog.items()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(held / 2**20, 1)
+
+
+# Memory the in-memory session store holds once filled to its cap with
+# `sessions` carts, and again after as many more sessions pushed it past the
+# cap (the LRU evicts, so both should match). No app or database involved.
+def measure_session_store(sessions: int, cart_size: int) -> dict:
+    import tracemalloc
+    import session_store
+
+    store = session_store.MemorySessionOrderStore(max_sessions=sessions)
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        for i in range(2 * sessions):
+            if i == sessions:
+                held_at_cap, _ = tracemalloc.get_traced_memory()
+            # Fresh strings per session, as parsed from each webhook request
+            cart = {f"Bench Dish {j}": 1.0 for j in range(1, cart_size + 1)}
+            store.add(f"bench-{i}", cart)
+        held_after, peak = tracemalloc.get_traced_memory()
+        wall_time = time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+    stats = store.stats()
+    return {
+        "sessions_held": stats["sessions"],
+        "evicted": stats["evicted"],
+        "wall_time_s": round(wall_time, 3),
+        "memory_at_cap_mb": round(held_at_cap / 2**20, 1),
+        "memory_past_cap_mb": round(held_after / 2**20, 1),
+        "peak_memory_mb": round(peak / 2**20, 1),
+        "bytes_per_session": round(held_after / stats["sessions"]),
+    }
+
+
+# A wrong-password attempt, as in a credential-stuffing burst. Once the rate
+# limiter kicks in for the username these are answered with a 429.
+async def bad_login(client, recorder, username, count_queries):
+    await recorder.request(
+        client,
+        "login:wrong-password",
+        "POST",
+        "/",
+        count_queries,
+        data={"username": username, "password": "not-the-password"},
+    )
+
+
+def storm_username(i: int) -> str:
+    return f"{BENCHMARK_USER[0]}-storm-{i % LOGIN_STORM_USERS}"
+
+
+# Executor running each call right away in the caller's thread
+class InlineExecutor(concurrent.futures.Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+# Fresh rate limits, so every storm pass gets the same number of verifies
+def reset_login_limiter():
+    import password_helper
+
+    password_helper.login_limiter = password_helper.LoginRateLimiter()
+
+
+# bcrypt verifies block the event loop, as before they had their own threads
+def verify_on_event_loop():
+    import password_helper
+
+    reset_login_limiter()
+    password_helper._executor = InlineExecutor()
+
+
+# A signed-in visitor loading the menu pages twice. With `revalidate` the
+# second load sends the ETag back, as a browser does, and gets a 304.
+async def page_visit(client, recorder, count_queries, revalidate):
+    for url in ("/index", "/food-items"):
+        response = await recorder.request(
+            client, f"page:{url}", "GET", url, count_queries
+        )
+        etag = response.headers.get("etag") if response is not None else None
+        headers = {"If-None-Match": etag} if revalidate and etag else {}
+        await recorder.request(
+            client, f"page:{url} again", "GET", url, count_queries, headers=headers
+        )
+
+
+# Every page is rendered from its templates, as before the render cache
+def disable_render_cache():
+    import page_cache
+
+    page_cache.render_cache.clear()
+    page_cache.render_cache.max_entries = 0
+
+
+# The login page as an anonymous visitor, then the menu pages as a signed-in
+# user (an anonymous GET / would just be redirected)
+async def hit_pages(anonymous_client, client, recorder, count_queries):
+    await recorder.request(anonymous_client, "page:/", "GET", "/", count_queries)
+    for url in ("/index", "/food-items"):
+        await recorder.request(client, f"page:{url}", "GET", url, count_queries)
+
+
+async def run_pool(jobs, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            await job
+
+    await asyncio.gather(*(run(job) for job in jobs))
+
+
+def seed_database(menu_size: int) -> list:
+    import db_helper
+    import password_helper
+    from sqlalchemy import text
+
+    db_helper.init_db()
+    names = [f"Bench Dish {i}" for i in range(1, menu_size + 1)]
+    with db_helper.get_engine().begin() as connection:
+        connection.execute(
+            text("DELETE FROM food_items WHERE name LIKE 'Bench Dish %'")
+        )
+        connection.execute(
+            text(
+                "INSERT INTO food_items (name, description, price, available) "
+                "VALUES (:name, :description, :price, 1)"
+            ),
+            [
+                {"name": name, "description": "Load test dish", "price": 5 + i % 20}
+                for i, name in enumerate(names)
+            ],
+        )
+        usernames = [BENCHMARK_USER[0]] + [
+            storm_username(i) for i in range(LOGIN_STORM_USERS)
+        ]
+        connection.execute(
+            text("DELETE FROM users WHERE username = :username"),
+            [{"username": username} for username in usernames],
+        )
+        hashed_password = password_helper.pwd_context.hash(BENCHMARK_USER[1])
+        connection.execute(
+            text(
+                "INSERT INTO users (username, email, full_name, hashed_password, "
+                "is_active, is_admin, token_version) "
+                "VALUES (:username, :email, 'Bench User', :password, 1, 0, 0)"
+            ),
+            [
+                {
+                    "username": username,
+                    "email": f"{username}@example.com",
+                    "password": hashed_password,
+                }
+                for username in usernames
+            ],
+        )
+    return names
+
+
+# Counts bcrypt verifies, the cost a login storm is meant to cap
+def install_verify_counter() -> list:
+    import password_helper
+
+    verifies = [0]
+    verify = password_helper.verify_and_update
+
+    async def counted_verify(plain_password, hashed_password):
+        verifies[0] += 1
+        return await verify(plain_password, hashed_password)
+
+    password_helper.verify_and_update = counted_verify
+    return verifies
+
+
+# Adds template render time to the request's _request_render total
+def install_render_timer():
+    import metrics
+
+    record_render = metrics.record_render
+
+    def timed_render(seconds):
+        render = _request_render.get()
+        if render is not None:
+            render[0] += seconds
+        record_render(seconds)
+
+    metrics.record_render = timed_render
+
+
+def install_query_counter():
+    import db_helper
+    from sqlalchemy import event
+
+    def count(*args):
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+    for engine in (db_helper.get_engine(), db_helper.get_async_engine().sync_engine):
+        event.listen(engine, "before_cursor_execute", count)
+
+
+# Runs the database calls of the webhook path on the synchronous engine,
+# blocking the event loop as the handlers did before the async engine
+def install_sync_db_path():
+    import db_helper
+    import menu_cache
+
+    async def save_order(order_items, user_id=None, lookup=None):
+        return db_helper.save_order(order_items, user_id, lookup)
+
+    async def get_order_statuses(order_ids):
+        with db_helper.get_engine().connect() as connection:
+            result = connection.execute(
+                db_helper.SELECT_ORDER_STATUSES, {"order_ids": list(order_ids)}
+            )
+            return {row.order_id: row.status for row in result.fetchall()}
+
+    async def ensure_menu_loaded():
+        menu_cache.catalog.items()
+
+    db_helper.save_order_async = save_order
+    db_helper.get_order_statuses_async = get_order_statuses
+    menu_cache.catalog.ensure_loaded_async = ensure_menu_loaded
+
+
+def benchmark_passes(args, webhook_client, page_client, recorder, menu, in_process):
+    def conversations(label):
+        return [
+            replay_session(
+                webhook_client, recorder, f"{label}bench-{i}", menu, in_process
+            )
+            for i in range(args.sessions)
+        ]
+
+    def dispatch_rounds(count):
+        return [
+            dispatch_round(webhook_client, recorder, f"bench-{i}", menu, in_process)
+            for i in range(count)
+        ]
+
+    # --sessions wrong-password logins over LOGIN_STORM_USERS accounts, with
+    # webhook traffic on the remaining workers for as long as the storm lasts
+    def login_storm():
+        storm_over = asyncio.Event()
+
+        async def storm():
+            await run_pool(
+                [
+                    bad_login(webhook_client, recorder, storm_username(i), in_process)
+                    for i in range(args.sessions)
+                ],
+                args.concurrency,
+            )
+            storm_over.set()
+
+        async def traffic(worker):
+            while not storm_over.is_set():
+                await dispatch_round(
+                    webhook_client, recorder, f"storm-{worker}", menu, in_process
+                )
+
+        return [storm()] + [traffic(i) for i in range(max(1, args.concurrency - 1))]
+
+    if args.mode == "engines":
+        return [
+            ("async", None, conversations("async-")),
+            ("sync", install_sync_db_path, conversations("sync-")),
+        ]
+    if args.mode == "tracking":
+        import db_helper
+
+        order_ids = [
+            db_helper.save_order({random.choice(menu): 1})[0]
+            for _ in range(args.sessions)
+        ]
+        return [
+            (
+                label,
+                setup,
+                [
+                    track_polls(webhook_client, recorder, order_id, in_process)
+                    for order_id in order_ids
+                ],
+            )
+            for label, setup in (("cached", None), ("uncached", disable_status_cache))
+        ]
+    if args.mode == "pages":
+        return [
+            (
+                label,
+                setup,
+                [
+                    page_visit(page_client, recorder, in_process, revalidate)
+                    for _ in range(args.page_requests)
+                ],
+            )
+            for label, setup, revalidate in (
+                ("cached", None, True),
+                ("uncached", disable_render_cache, False),
+            )
+        ]
+    if args.mode == "login":
+        return [
+            ("quiet", None, dispatch_rounds(args.sessions)),
+            ("storm", reset_login_limiter, login_storm()),
+            ("blocking-storm", verify_on_event_loop, login_storm()),
+        ]
+    if args.mode == "menu":
+        jobs = [
+            menu_queries(webhook_client, recorder, menu, in_process)
+            for _ in range(args.page_requests)
+        ]
+    elif args.mode == "dispatch":
+        jobs = dispatch_rounds(args.sessions)
+    else:
+        jobs = conversations("")
+        jobs += [
+            hit_pages(webhook_client, page_client, recorder, in_process)
+            for _ in range(args.page_requests)
+        ]
+    return [("", None, jobs)]
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+
+    in_process = args.base_url is None
+    if in_process:
+        import main
+
+        menu = seed_database(args.menu_size)
+        catalog_memory = (
+            measure_catalog_memory() if args.mode == "menu" else None
+        )
+        install_query_counter()
+        install_render_timer()
+        verifies = install_verify_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://benchmark"
+        lifespan = main.app.router.lifespan_context(main.app)
+    else:
+        menu = args.menu_items.split(",")
+        transport = None
+        base_url = args.base_url
+        lifespan = None
+        verifies = None
+        catalog_memory = None
+
+    recorder = Recorder()
+    async with httpx.AsyncClient(
+        transport=transport, base_url=base_url
+    ) as webhook_client, httpx.AsyncClient(
+        transport=transport, base_url=base_url
+    ) as page_client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            await page_client.post(
+                "/",
+                data={"username": BENCHMARK_USER[0], "password": BENCHMARK_USER[1]},
+            )
+            # Warm caches and pools so the first requests don't skew percentiles
+            await hit_pages(webhook_client, page_client, Recorder(), False)
+            await replay_session(
+                webhook_client, Recorder(), "warmup", menu, False
+            )
+
+            if args.mode == "login" and verifies is not None:
+                verifies[0] = 0
+            # (label, setup run before the pass or None, jobs), one pass per
+            # configuration being compared
+            passes = benchmark_passes(
+                args, webhook_client, page_client, recorder, menu, in_process
+            )
+            started = time.perf_counter()
+            pass_times = {}
+            for label, setup, jobs in passes:
+                if setup is not None:
+                    setup()
+                recorder.prefix = f"{label}:" if label else ""
+                random.shuffle(jobs)
+                pass_started = time.perf_counter()
+                await run_pool(jobs, args.concurrency)
+                pass_times[label] = time.perf_counter() - pass_started
+            recorder.prefix = ""
+            wall_time = time.perf_counter() - started
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    result = recorder.report(wall_time)
+    if len(pass_times) > 1:
+        # A login storm pass is judged by the webhook traffic running beside it
+        measured = "dispatch:" if args.mode == "login" else ""
+        result["passes"] = {
+            label: recorder.totals(seconds, f"{label}:{measured}")
+            for label, seconds in pass_times.items()
+        }
+    if verifies is not None and args.mode == "login":
+        result["password_verifies"] = verifies[0]
+    if catalog_memory is not None:
+        result["catalog_memory_mb"] = catalog_memory
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Returns one message per endpoint whose p95 grew by more than `tolerance`
+# (a fraction) over the baseline run
+def find_regressions(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, endpoint in result.get("endpoints", {}).items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous["p95_ms"]:
+            continue
+        if endpoint["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']} ms -> {endpoint['p95_ms']} ms"
+            )
+        if (previous["queries_per_request"] or 0) < (
+            endpoint["queries_per_request"] or 0
+        ):
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']} -> "
+                f"{endpoint['queries_per_request']}"
+            )
+    return regressions
+
+
+def print_report(result: dict):
+    print(
+        f"{result['requests']} requests, {result['errors']} errors in "
+        f"{result['wall_time_s']} s ({result['throughput_rps']} req/s)"
+    )
+    width = max([24] + [len(name) + 2 for name in result["endpoints"]])
+    print(
+        f"{'endpoint':<{width}}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'queries':>9}{'render ms':>11}"
+    )
+    for name, endpoint in result["endpoints"].items():
+        queries = endpoint["queries_per_request"]
+        render = endpoint["render_ms_per_request"]
+        print(
+            f"{name:<{width}}{endpoint['requests']:>9}{endpoint['p50_ms']:>10}"
+            f"{endpoint['p95_ms']:>10}{endpoint['p99_ms']:>10}"
+            f"{'-' if queries is None else queries:>9}"
+            f"{'-' if render is None else render:>11}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay Dialogflow webhook and page traffic against ChatCuisine"
+    )
+    parser.add_argument(
+        "--database-url",
+        help="database for the in-process app (default: a temporary SQLite file)",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="benchmark an already running server instead (no query counts)",
+    )
+    parser.add_argument(
+        "--menu-items",
+        default="Pav Bhaji,Mango Lassi,Chole Bhature,Masala Dosa",
+        help="comma-separated food names to order with --base-url",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=[
+            "full",
+            "dispatch",
+            "login",
+            "menu",
+            "sessions",
+            "engines",
+            "tracking",
+            "pages",
+        ],
+        default="full",
+        help="full: conversations and pages; dispatch: webhook routing only; "
+        "login: webhook traffic alone, then during a burst of wrong-password "
+        "logins, then with bcrypt on the event loop; menu: the /api/food-items "
+        "reads (use with a large --menu-size); sessions: memory of the "
+        "in-memory session store holding --sessions carts; engines: the "
+        "conversations on the async engine, then on the blocking sync engine; "
+        "tracking: status polls of --sessions orders with the order-status "
+        "cache, then without it; pages: /index and /food-items loads with the "
+        "render cache and ETag revalidation, then without either",
+    )
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--page-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--menu-size", type=int, default=50)
+    parser.add_argument(
+        "--cart-size", type=int, default=3, help="dishes per cart (sessions mode)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed p95 growth (fraction)"
+    )
+    args = parser.parse_args()
+
+    if args.mode in ("engines", "tracking", "pages") and args.base_url is not None:
+        parser.error(f"--mode {args.mode} runs the app in-process, drop --base-url")
+    random.seed(args.seed)
+    if args.base_url is None:
+        database_url = args.database_url or "sqlite:///" + os.path.join(
+            tempfile.mkdtemp(prefix="chatcuisine-bench-"), "bench.db"
+        )
+        # Must be set before db_helper is imported
+        os.environ["DATABASE_URL"] = database_url
+        os.environ.setdefault("SESSION_SECRET_KEY", "benchmark")
+        # A login storm needs bcrypt at its production cost to mean anything
+        os.environ.setdefault("BCRYPT_ROUNDS", "12" if args.mode == "login" else "4")
+
+    if args.mode == "sessions":
+        result = measure_session_store(args.sessions, args.cart_size)
+    else:
+        result = asyncio.run(run_benchmark(args))
+    result.update(
+        {
+            "commit": git_commit(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": "external" if args.base_url else os.environ["DATABASE_URL"],
+            "parameters": {
+                "mode": args.mode,
+                "sessions": args.sessions,
+                "page_requests": args.page_requests,
+                "concurrency": args.concurrency,
+                "menu_size": args.menu_size,
+                "cart_size": args.cart_size,
+            },
+        }
+    )
+    if "endpoints" in result:
+        print_report(result)
+        for label, totals in result.get("passes", {}).items():
+            print(
+                f"{label}: {totals['requests']} requests, {totals['errors']} errors, "
+                f"{totals['throughput_rps']} req/s, p50 {totals['p50_ms']} ms, "
+                f"p99 {totals['p99_ms']} ms, "
+                f"{totals['queries_per_1k_requests']} queries per 1k requests, "
+                f"{totals['render_ms_per_request']} ms rendering per request"
+            )
+    else:
+        print(
+            f"{result['sessions_held']} sessions held, {result['evicted']} evicted: "
+            f"{result['memory_at_cap_mb']} MB at the cap, "
+            f"{result['memory_past_cap_mb']} MB past it "
+            f"(peak {result['peak_memory_mb']} MB, "
+            f"{result['bytes_per_session']} bytes per session)"
+        )
+    if "password_verifies" in result:
+        print(f"bcrypt verifies: {result['password_verifies']}")
+    if "catalog_memory_mb" in result:
+        print(f"menu catalog memory: {result['catalog_memory_mb']} MB")
+    with open(args.output, "w") as file:
+        json.dump(result, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(result, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
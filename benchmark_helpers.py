@@ -0,0 +1,73 @@
+import argparse
+import timeit
+import generic_helper
+
+# Microbenchmark of the webhook helpers in generic_helper: session-id parsing
+# and cart summary rendering, each timed over --calls calls
+
+SESSION_CONTEXT = (
+    "projects/chat-cuisine/agent/sessions/{}/contexts/ongoing-order"
+)
+
+
+def bench_session_ids(calls: int, sessions: int) -> float:
+    names = [SESSION_CONTEXT.format(f"session-{i}") for i in range(sessions)]
+
+    def run():
+        for i in range(calls):
+            generic_helper.extract_session_id(names[i % sessions])
+
+    return timeit.timeit(run, number=1)
+
+
+# Replays add-one-item conversations over `cart_size` dishes: every call
+# renders a cart that differs from the session's previous render in one line
+def cart_steps(calls: int, sessions: int, cart_size: int) -> list:
+    menu = [f"Dish {i}" for i in range(cart_size)]
+    carts = [{} for _ in range(sessions)]
+    steps = []
+    for i in range(calls):
+        cart = carts[i % sessions]
+        food_item = menu[(i // sessions) % cart_size]
+        cart[food_item] = cart.get(food_item, 0) + 1
+        steps.append((f"session-{i % sessions}", dict(cart)))
+    return steps
+
+
+def bench_cart_full(steps: list) -> float:
+    def run():
+        for _, cart in steps:
+            generic_helper.get_str_from_food_dict(cart)
+
+    return timeit.timeit(run, number=1)
+
+
+def bench_cart_incremental(steps: list) -> float:
+    renderer = generic_helper.CartSummaryRenderer()
+
+    def run():
+        for session_id, cart in steps:
+            renderer.render(session_id, cart)
+
+    return timeit.timeit(run, number=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the generic_helper helpers")
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--cart-size", type=int, default=5)
+    args = parser.parse_args()
+
+    steps = cart_steps(args.calls, args.sessions, args.cart_size)
+    results = {
+        "extract_session_id": bench_session_ids(args.calls, args.sessions),
+        "cart summary (full re-render)": bench_cart_full(steps),
+        "cart summary (incremental)": bench_cart_incremental(steps),
+    }
+    for name, seconds in results.items():
+        print(f"{name:<32}{seconds:>8.3f} s  {seconds / args.calls * 1e6:>7.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
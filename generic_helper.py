@@ -1,14 +1,75 @@
 import re
+from collections import OrderedDict
+from functools import lru_cache
+
+SESSION_ID_PATTERN = re.compile(r"/sessions/(.*?)/contexts/")
+SESSION_NAME_PATTERN = re.compile(r"/sessions/([^/]+)$")
+# Sessions whose last rendered cart is kept for incremental re-rendering
+CART_SUMMARY_SESSIONS = 10000
+
+
+def format_cart_line(food_item: str, quantity) -> str:
+    return f"{int(quantity)} {food_item}"
+
 
 def get_str_from_food_dict(food_dict: dict):
-    result = ", ".join([f"{int(value)} {key}" for key, value in food_dict.items()])
+    result = ", ".join(
+        [format_cart_line(key, value) for key, value in food_dict.items()]
+    )
     return result
 
 
+# Incremental cart summaries per session: a render re-formats only the lines
+# whose quantity changed since the session's previous render, and hands back
+# the previous string untouched when nothing changed
+class CartSummaryRenderer:
+    def __init__(self, max_sessions=CART_SUMMARY_SESSIONS):
+        self.max_sessions = max_sessions
+        # session_id -> (quantities, {food_item: line}, summary) of the last render
+        self._carts = OrderedDict()
+
+    def render(self, session_id: str, food_dict: dict) -> str:
+        quantities, lines, summary = self._carts.pop(session_id, ({}, {}, None))
+        # Equal dicts in the same order render to the same summary
+        if summary is None or quantities != food_dict or (
+            list(quantities) != list(food_dict)
+        ):
+            new_lines = {}
+            for food_item, quantity in food_dict.items():
+                if quantities.get(food_item) == quantity:
+                    new_lines[food_item] = lines[food_item]
+                else:
+                    new_lines[food_item] = format_cart_line(food_item, quantity)
+            lines = new_lines
+            summary = ", ".join(lines.values())
+            quantities = dict(food_dict)
+
+        self._carts[session_id] = (quantities, lines, summary)
+        while len(self._carts) > self.max_sessions:
+            self._carts.popitem(last=False)
+        return summary
+
+    def discard(self, session_id: str):
+        self._carts.pop(session_id, None)
+
+
+cart_summaries = CartSummaryRenderer()
+
+
+# A Dialogflow session keeps sending the same context names, so parsed ids
+# are memoized (bounded, to survive many short-lived sessions)
+@lru_cache(maxsize=10000)
 def extract_session_id(session_str: str):
-    match = re.search(r"/sessions/(.*?)/contexts/", session_str)
+    match = SESSION_ID_PATTERN.search(session_str)
     if match:
-        extracted_string = match.group(0)
+        extracted_string = match.group(1)
         return extracted_string
 
     return ""
+
+
+# Session id from the request's own session name, for requests that carry no
+# output contexts. Returns "" when the name has no session id.
+def session_id_from_name(session_name: str):
+    match = SESSION_NAME_PATTERN.search(session_name)
+    return match.group(1) if match else ""
@@ -1,22 +1,67 @@
-from fastapi import FastAPI, HTTPException, Request, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Request,
+    Form,
+    Depends,
+    File,
+    Query,
+    UploadFile,
+    status,
+)
+from fastapi.responses import (
+    HTMLResponse,
+    RedirectResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
+from starlette.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-from pydantic import BaseModel
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, Field, ValidationError
+from typing import List
+from datetime import date, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
+import asyncio
 import os
+import time
 import logging
-from passlib.context import CryptContext
+from collections import OrderedDict
 import db_helper
 import generic_helper
-from db_helper import FoodItem, SessionLocal, User
-from jose import JWTError, jwt
+import menu_cache
+import session_store
+import order_status
+import analytics
+import recommendations
+import tracking_queue
+import webhook_dedup
+import menu_io
+import password_helper
+import page_cache
+import static_assets
+import metrics
+import template_cache
+from markupsafe import Markup
+from db_helper import AsyncSessionLocal, FoodItem, OrderStatusEnum, User
+from jose import ExpiredSignatureError, JWTError, jwt
 
 app = FastAPI()
-templates = Jinja2Templates(directory="templates")
-inprogress_orders = {}
+templates = Jinja2Templates(env=template_cache.create_environment())
+templates.env.globals["asset_url"] = static_assets.asset_url
+templates.env.globals["thumbnail_urls"] = static_assets.thumbnail_urls
+inprogress_orders = session_store.create_session_store()
+
+
+# Function to call a session store method, in the threadpool when the backend
+# does blocking I/O so a locked SQLite file can't stall the event loop
+async def call_session_store(method, *args):
+    if inprogress_orders.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,164 +75,388 @@ if not SECRET_KEY:
 
 # Add the SessionMiddleware with the secret key
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+# Outermost, so the latency it records covers the session middleware too
+app.add_middleware(metrics.MetricsMiddleware)
+
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Lifetime of a session JWT. Claims are trusted without a DB lookup until
+# expiry, then re-checked against the user's token_version and reissued.
+JWT_TTL_SECONDS = int(os.getenv("JWT_TTL_SECONDS", "900"))
+VERIFIED_TOKEN_CACHE_SIZE = 1024
+
+# token -> verified claims, so repeated page views skip signature checks
+verified_tokens = OrderedDict()
+# user id -> lowest token_version still valid, for revocations made here
+revoked_token_versions = {}
 
 
 # JWT token related functions
-def create_jwt_token(username: str, role: str) -> str:
-    payload = {"sub": username, "role": role}
+def create_jwt_token(user: User) -> str:
+    payload = {
+        "sub": user.username,
+        "role": "admin" if user.is_admin else "user",
+        "uid": user.id,
+        "name": user.full_name,
+        "ver": user.token_version or 0,
+        "exp": int(time.time()) + JWT_TTL_SECONDS,
+    }
     token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
     return token
 
 
 def decode_jwt_token(token: str) -> dict:
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        if payload["exp"] > time.time():
+            verified_tokens.move_to_end(token)
+            return payload
+        del verified_tokens[token]
+        raise ExpiredSignatureError("Signature has expired.")
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return payload
-    except JWTError as e:
+    except ExpiredSignatureError:
+        raise
+    except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if "exp" not in payload or "uid" not in payload:
+        # Tokens issued before claims were added are refreshed like expired ones
+        raise ExpiredSignatureError("Token predates the current claims.")
+
+    verified_tokens[token] = payload
+    if len(verified_tokens) > VERIFIED_TOKEN_CACHE_SIZE:
+        verified_tokens.popitem(last=False)
+    return payload
+
 
+def is_revoked(payload: dict) -> bool:
+    return payload["ver"] < revoked_token_versions.get(payload["uid"], 0)
 
-def get_current_user(request: Request):
+
+def start_session(request: Request, user: User):
+    request.session["user"] = user.username
+    request.session["is_admin"] = user.is_admin
+    request.session["token"] = create_jwt_token(user)
+
+
+# Re-checks an expired token's user against the DB and issues a fresh token,
+# unless the user is gone, inactive or had their tokens revoked since
+async def refresh_session(request: Request, token: str):
+    payload = jwt.decode(
+        token, SECRET_KEY, algorithms=["HS256"], options={"verify_exp": False}
+    )
+    db_helper.get_async_engine()
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_username(db, payload.get("sub"))
+    if (
+        user is None
+        or not user.is_active
+        or ("ver" in payload and payload["ver"] != (user.token_version or 0))
+    ):
+        request.session.clear()
+        return None
+    start_session(request, user)
+    return decode_jwt_token(request.session["token"])
+
+
+# Returns the verified JWT claims of the logged-in user, or None
+async def get_current_user(request: Request):
     token = request.session.get("token")
-    if token:
-        try:
-            payload = decode_jwt_token(token)
-            username = payload.get("sub")
-            role = payload.get("role")
-            return username, role
-        except JWTError as e:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    return None, None
+    if not token:
+        return None
+    try:
+        payload = decode_jwt_token(token)
+    except ExpiredSignatureError:
+        return await refresh_session(request, token)
+    if is_revoked(payload):
+        request.session.clear()
+        return None
+    return payload
 
 
 # Restrict access to admin-only endpoints
-def admin_only(request: Request):
-    _, role = get_current_user(request)
-    if role != "admin":
+async def admin_only(request: Request):
+    payload = await get_current_user(request)
+    if payload is None or payload["role"] != "admin":
         raise HTTPException(
             status_code=403, detail="Only admins can access this feature"
         )
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Called after every admin edit of food_items
+def invalidate_menu():
+    menu_cache.catalog.invalidate()
+    page_cache.render_cache.clear()
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Define your get_db function to obtain an async database session
+async def get_db():
+    # Creating the engine on first use also binds AsyncSessionLocal
+    db_helper.get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
 
 
-# Define your get_db function to obtain a database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Only the parts of Dialogflow's WebhookRequest the handlers use are declared,
+# everything else in the payload is skipped while parsing
+class Intent(BaseModel):
+    displayName: str = ""
+
+
+class OutputContext(BaseModel):
+    name: str = ""
+
+
+class QueryResult(BaseModel):
+    intent: Intent = Intent()
+    # Validated against the intent's parameter model once the intent is known
+    parameters: dict = {}
+    outputContexts: List[OutputContext] = []
+
+
+class WebhookRequest(BaseModel):
+    responseId: str = ""
+    # projects/<project>/agent/sessions/<session id>
+    session: str = ""
+    queryResult: QueryResult = QueryResult()
+
+
+# Parameters each intent's handler reads, under Dialogflow's entity names
+class NoParameters(BaseModel):
+    pass
+
+
+class AddToOrderParameters(BaseModel):
+    food_items: List[str] = Field(alias="food-item")
+    quantities: List[float] = Field(alias="number")
+
+
+class RemoveFromOrderParameters(BaseModel):
+    food_items: List[str] = Field(alias="food-item")
+
+
+class TrackOrderParameters(BaseModel):
+    order_id: int = Field(alias="number")
+
+
+# Intent display name -> (handler, parameter model), filled once at import by
+# @intent_handler
+intent_handlers = {}
+
+
+def intent_handler(intent: str, parameters_model=NoParameters):
+    def register(handler):
+        intent_handlers[intent] = (handler, parameters_model)
+        return handler
+
+    return register
+
+
+async def fallback_handler(parameters: NoParameters, session_id: str):
+    return JSONResponse(
+        content={
+            "fulfillmentText": "Sorry, I didn't get that. You can add, remove or complete an order, or track one."
+        }
+    )
+
+
+# Reply for a known intent whose parameters are missing or malformed, asking
+# again for what that intent needs
+async def unclear_parameters_handler(intent: str, session_id: str):
+    if intent.startswith("track.order"):
+        fulfillment_text = "Sorry I didn't understand. Can you please tell me your order id again?"
+    else:
+        fulfillment_text = "Sorry I didn't understand. Can you please specify food items and quantities clearly?"
+    return JSONResponse(content={"fulfillmentText": fulfillment_text})
 
 
 @app.post("/webhook")
 async def handle_request(request: Request):
-    # Retrieve the JSON data from the request
-    payload = await request.json()
-
-    # Extract the necessary information from the payload
-    # based on the structure of the WebhookRequest from Dialogflow
-    intent = payload["queryResult"]["intent"]["displayName"]
-    parameters = payload["queryResult"]["parameters"]
-    output_contexts = payload["queryResult"]["outputContexts"]
-    session_id = generic_helper.extract_session_id(output_contexts[0]["name"])
-
-    intent_handler_dict = {
-        "order.add - context: ongoing-order": add_to_order,
-        "order.remove - context: ongoing-order": remove_from_order,
-        "order.complete - context: ongoing-order": complete_order,
-        "track.order - context: ongoing-tracking": track_order,
-    }
+    try:
+        payload = WebhookRequest.model_validate_json(await request.body())
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid webhook request")
+
+    query_result = payload.queryResult
+    output_contexts = query_result.outputContexts
+    session_id = (
+        generic_helper.extract_session_id(output_contexts[0].name)
+        if output_contexts
+        else ""
+    )
+    if not session_id:
+        # Requests without contexts still name their session at the top level
+        session_id = generic_helper.session_id_from_name(payload.session)
+    if not session_id:
+        # An empty id would make every such request share one cart
+        raise HTTPException(status_code=400, detail="Webhook request has no session")
+
+    handler, parameters_model = intent_handlers.get(
+        query_result.intent.displayName, (fallback_handler, NoParameters)
+    )
+    try:
+        parameters = parameters_model.model_validate(query_result.parameters)
+    except ValidationError:
+        handler = unclear_parameters_handler
+        parameters = query_result.intent.displayName
+
+    if not payload.responseId:
+        return await handler(parameters, session_id)
+    # Dialogflow retries reuse the responseId: they get the first call's reply
+    # instead of placing or changing the order again
+    return await webhook_dedup.deduplicator.run(
+        (session_id, payload.responseId),
+        lambda: handler(parameters, session_id),
+    )
 
-    return intent_handler_dict[intent](parameters, session_id)
 
+async def save_to_db(order_items: dict, lookup=None):
+    # Order header, items and tracking status are written in one transaction,
+    # with food names resolved from the in-memory menu catalog
+    await menu_cache.catalog.ensure_loaded_async()
+    return await db_helper.save_order_async(
+        order_items, lookup=lookup or menu_cache.catalog.lookup
+    )
 
-def save_to_db(order_items: dict):
-    next_order_id = db_helper.get_next_order_id()
 
-    # Insert individual items along with quantity in order_items table
-    for food_item, quantity in order_items.items():
-        rcode = db_helper.insert_order_item(food_item, quantity, next_order_id)
-        if rcode == -1:
-            return -1
+# Function to ask about cart lines that don't clearly name a menu item or name
+# one that is sold out, or return None when every line resolved confidently
+def confirmation_text(resolved: dict):
+    unknown = [name for name, (item, _) in resolved.items() if item is None]
+    unavailable = [
+        item.name
+        for item, _ in resolved.values()
+        if item is not None and not item.available
+    ]
+    unsure = [
+        (name, item.name)
+        for name, (item, score) in resolved.items()
+        if item is not None and score < menu_cache.FUZZY_MATCH_CONFIDENT_SCORE
+    ]
+    if unknown:
+        return (
+            f"Sorry, I couldn't find {', '.join(unknown)} on our menu. "
+            "Please remove it from your order or add a menu item instead."
+        )
+    if unavailable:
+        return (
+            f"Sorry, {', '.join(unavailable)} is not available right now. "
+            "Please remove it from your order."
+        )
+    if unsure:
+        guesses = ", ".join(f"{menu_name} for {name}" for name, menu_name in unsure)
+        return (
+            f"Did you mean {guesses}? "
+            "Please remove and add it again using its menu name."
+        )
+    return None
 
-    # Now insert order tracking status
-    db_helper.insert_order_tracking(next_order_id, "Order Received, it's in processing")
-    return next_order_id
 
+@intent_handler("order.complete - context: ongoing-order")
+async def complete_order(parameters: NoParameters, session_id: str):
+    order = await call_session_store(inprogress_orders.complete, session_id)
+    if order is None:
+        return JSONResponse(
+            content={"fulfillmentText": "I am having trouble finding your order"}
+        )
 
-def complete_order(parameters: dict, session_id: str):
-    if session_id not in inprogress_orders:
-        fullfillmentText = "I am having trouble finding your order"
+    # Dialogflow entity values don't always spell the menu name exactly: every
+    # line is matched in one batch, and unsure matches are confirmed first
+    await menu_cache.catalog.ensure_loaded_async()
+    resolved = menu_cache.catalog.resolve_scored(order)
+    fulfillment_text = confirmation_text(resolved)
+    if fulfillment_text is not None:
+        # The order stays open so the customer can fix it
+        await call_session_store(inprogress_orders.add, session_id, order)
+        return JSONResponse(content={"fulfillmentText": fulfillment_text})
+
+    def lookup(food_item):
+        return resolved[food_item][0]
+
+    generic_helper.cart_summaries.discard(session_id)
+    order_id, order_total = await save_to_db(order, lookup)
+    if order_id == -1:
+        fulfillment_text = (
+            "Sorry, I couldn't process your order due to a backend error. "
+            "Please place a new order again"
+        )
     else:
-        order = inprogress_orders[session_id]
-        order_id = save_to_db(order)
-        if order_id == -1:
-            fullfillment_text = (
-                "Sorry, I couldn't process your order due to a backend error. "
-                "Please place a new order again"
-            )
-        else:
-            order_total = db.helper.get_total_order_price(order_id)
-            fullfillment_text = (
-                f"Order placed successfully! Your order id is: {order_id}. "
-                "Your total order amount is: {order_total}"
-            )
-        del inprogress_orders[session_id]
-    return JSONResponse(content={"fulfillmentText": fullfillment_text})
-
-
-def add_to_order(parameters: dict, session_id: str):
-    food_items = parameters["food-item"]
-    quantities = parameters["number"]
+        order_status.cache.publish(order_id, OrderStatusEnum.processing.name)
+        analytics.model.record_order(order_id, order, lookup)
+        recommendations.engine.record_order(
+            [item.id for item, _ in resolved.values()]
+        )
+        fulfillment_text = (
+            f"Order placed successfully! Your order id is: {order_id}. "
+            f"Your total order amount is: {order_total}"
+        )
+    return JSONResponse(content={"fulfillmentText": fulfillment_text})
+
+
+def cart_item_ids(order: dict) -> list:
+    item_ids = []
+    for food_item in order:
+        item = menu_cache.catalog.lookup(food_item)
+        if item is not None:
+            item_ids.append(item.id)
+    return item_ids
+
+
+def is_available(item_id: int) -> bool:
+    item = menu_cache.catalog.get(item_id)
+    return item is not None and bool(item.available)
+
+
+# " Customers often add X with that." for the item most often ordered with
+# the cart, or "" when there is none yet
+async def upsell_text(order: dict) -> str:
+    await menu_cache.catalog.ensure_loaded_async()
+    suggested = recommendations.engine.suggest(
+        cart_item_ids(order), k=1, allowed=is_available
+    )
+    if not suggested:
+        return ""
+    name = menu_cache.catalog.get(suggested[0]).name
+    return f" Customers often add {name} with that."
+
+
+@intent_handler("order.add - context: ongoing-order", AddToOrderParameters)
+async def add_to_order(parameters: AddToOrderParameters, session_id: str):
+    food_items = parameters.food_items
+    quantities = parameters.quantities
 
     if len(food_items) != len(quantities):
         fulfillment_text = "Sorry I didn't understand. Can you please specify food items and quantities clearly?"
     else:
         new_food_dict = dict(zip(food_items, quantities))
+        current_order = await call_session_store(
+            inprogress_orders.add, session_id, new_food_dict
+        )
 
-        if session_id in inprogress_orders:
-            current_food_dict = inprogress_orders[session_id]
-            current_food_dict.update(new_food_dict)
-            inprogress_orders[session_id] = current_food_dict
-        else:
-            inprogress_orders[session_id] = new_food_dict
-
-        order_str = generic_helper.get_str_from_food_dict(inprogress_orders[session_id])
-        fulfillment_text = f"So far you have: {order_str}. Do you need anything else?"
+        order_str = generic_helper.cart_summaries.render(session_id, current_order)
+        upsell = await upsell_text(current_order)
+        fulfillment_text = (
+            f"So far you have: {order_str}.{upsell} Do you need anything else?"
+        )
 
     return JSONResponse(content={"fulfillmentText": fulfillment_text})
 
 
-def remove_from_order(parameters: dict, session_id: str):
-    if session_id not in inprogress_orders:
+@intent_handler("order.remove - context: ongoing-order", RemoveFromOrderParameters)
+async def remove_from_order(parameters: RemoveFromOrderParameters, session_id: str):
+    food_items = parameters.food_items
+    result = await call_session_store(
+        inprogress_orders.remove, session_id, food_items
+    )
+    if result is None:
         return JSONResponse(
             content={
                 "fulfillmentText": "I'm having a trouble finding your order. Sorry! Can you place a new order please?"
             }
         )
 
-    food_items = parameters["food-item"]
-    current_order = inprogress_orders[session_id]
-
-    removed_items = []
-    no_such_items = []
-
-    for item in food_items:
-        if item not in current_order:
-            no_such_items.append(item)
-        else:
-            removed_items.append(item)
-            del current_order[item]
+    removed_items, no_such_items, current_order = result
+    fulfillment_text = ""
 
     if len(removed_items) > 0:
         fulfillment_text = f'Removed {",".join(removed_items)} from your order!'
@@ -198,27 +467,130 @@ def remove_from_order(parameters: dict, session_id: str):
         )
 
     if len(current_order.keys()) == 0:
+        generic_helper.cart_summaries.discard(session_id)
         fulfillment_text += " Your order is empty!"
     else:
-        order_str = generic_helper.get_str_from_food_dict(current_order)
+        order_str = generic_helper.cart_summaries.render(session_id, current_order)
         fulfillment_text += f" Here is what is left in your order: {order_str}"
 
     return JSONResponse(content={"fulfillmentText": fulfillment_text})
 
 
-def track_order(parameters: dict):
-    order_id = int(parameters["number"])
-    order_status = db_helper.get_order_status(order_id)
-    if order_status:
-        fullfillmentText = (
-            f"Your order status for order id {order_id} is: {order_status}"
+@intent_handler("track.order - context: ongoing-tracking", TrackOrderParameters)
+async def track_order(parameters: TrackOrderParameters, session_id: str):
+    order_id = parameters.order_id
+    current_status = await order_status.cache.get(order_id)
+    if current_status:
+        fulfillment_text = (
+            f"Your order status for order id {order_id} is: {current_status}"
+        )
+    else:
+        fulfillment_text = f"Sorry, no order found for order id: {order_id}"
+    return JSONResponse(content={"fulfillmentText": fulfillment_text})
+
+
+app.mount(
+    "/static",
+    static_assets.PrecompressedStaticFiles(directory=static_assets.STATIC_DIR),
+    name="static",
+)
+
+
+@app.on_event("startup")
+async def warm_up_database():
+    await db_helper.warm_up_pool()
+
+
+# Co-occurrence counts come from the last offline rebuild when there is one,
+# otherwise they are rebuilt from order history in the background (unless
+# turned off, as on serverless) and otherwise start from live orders
+@app.on_event("startup")
+async def load_recommendations():
+    if (
+        not recommendations.engine.load()
+        and recommendations.RECOMMENDATIONS_REBUILD_ON_STARTUP
+    ):
+        app.state.recommendations_rebuild = asyncio.create_task(
+            run_in_threadpool(rebuild_recommendations)
+        )
+
+
+def rebuild_recommendations():
+    try:
+        recommendations.engine.rebuild()
+    except Exception as e:
+        print(f"An error occurred while rebuilding recommendations: {e}")
+
+
+# Compile templates before the first request instead of during it
+@app.on_event("startup")
+def precompile_templates():
+    template_cache.precompile(templates.env)
+
+
+@app.on_event("startup")
+async def start_tracking_writer():
+    tracking_queue.writer.start()
+
+
+# Queued status updates are written out before the worker exits
+@app.on_event("shutdown")
+async def flush_tracking_writer():
+    await tracking_queue.writer.close()
+
+
+# Long-poll for order status changes: returns as soon as the status differs
+# from `since`, or after `wait` seconds with the current status
+@app.get("/orders/{order_id}/status")
+async def get_order_status(order_id: int, since: str = None, wait: float = 0):
+    if wait > 0 and since is not None:
+        current_status = await order_status.cache.wait_for_change(
+            order_id, since, wait
         )
     else:
-        fullfillmentText = f"Sorry, no order found for order id: {order_id}"
-    return fullfillmentText
+        current_status = await order_status.cache.get(order_id)
+    if current_status is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return {"order_id": order_id, "status": current_status}
 
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.post("/orders/{order_id}/status", dependencies=[Depends(admin_only)])
+async def update_order_status(
+    order_id: int, new_status: str = Form(..., alias="status")
+):
+    if new_status not in OrderStatusEnum.__members__:
+        raise HTTPException(status_code=400, detail="Unknown order status")
+    if await order_status.cache.get(order_id) is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    # The write is queued, readers of this worker see the new status at once
+    await tracking_queue.writer.enqueue(order_id, new_status)
+    order_status.cache.publish(order_id, new_status)
+    return {"order_id": order_id, "status": new_status}
+
+
+class OrderStatusUpdate(BaseModel):
+    order_id: int
+    status: str
+
+
+# Bulk status feed for kitchen/dispatch integrations. Unknown orders and
+# statuses are reported back instead of failing the whole batch.
+@app.post("/orders/status", dependencies=[Depends(admin_only)])
+async def update_order_statuses(updates: List[OrderStatusUpdate]):
+    known = await order_status.cache.get_many({update.order_id for update in updates})
+    accepted = 0
+    rejected = []
+    for update in updates:
+        if (
+            update.status not in OrderStatusEnum.__members__
+            or known[update.order_id] is None
+        ):
+            rejected.append(update.order_id)
+            continue
+        await tracking_queue.writer.enqueue(update.order_id, update.status)
+        order_status.cache.publish(update.order_id, update.status)
+        accepted += 1
+    return {"accepted": accepted, "rejected": rejected}
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -235,17 +607,35 @@ async def login_page(request: Request):
 @app.post("/", response_class=HTMLResponse)
 async def login(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     username: str = Form(...),
     password: str = Form(...),
 ):
-    user = db.query(User).filter(User.username == username).first()
-    if user and verify_password(password, user.hashed_password):
-        request.session["user"] = user.username
-        request.session["is_admin"] = user.is_admin
-        role = "admin" if user.is_admin else "user"
-        token = create_jwt_token(user.username, role)
-        request.session["token"] = token  # Store the token in the session
+    # Repeated failures skip the (expensive) bcrypt verify altogether. The
+    # attempt is counted before verifying and forgiven only on success.
+    if not password_helper.login_limiter.allow(username):
+        return templates.TemplateResponse(
+            "login.html",
+            {
+                "request": request,
+                "error": "Too many failed attempts, please try again later",
+            },
+            status_code=429,
+        )
+
+    user = await get_user_by_username(db, username)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_helper.verify_and_update(
+            password, user.hashed_password
+        )
+    if valid:
+        password_helper.login_limiter.reset(username)
+        if new_hash:
+            # Stored hash predates the current BCRYPT_ROUNDS, upgrade it
+            user.hashed_password = new_hash
+            await db.commit()
+        start_session(request, user)
         if user.is_admin:
             return RedirectResponse("/admin", status_code=302)
         return RedirectResponse("/index", status_code=302)
@@ -254,18 +644,22 @@ async def login(
     )
 
 
-def get_current_admin_user(request: Request, db: Session = Depends(get_db)):
-    username = request.session.get("user")
-    if not username:
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+async def get_current_admin_user(request: Request):
+    payload = await get_current_user(request)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not user.is_admin:
+    if payload["role"] != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
         )
-    return user
+    return payload
 
 
 @app.get("/logout")
@@ -275,45 +669,131 @@ async def logout(request: Request):
 
 
 @app.get("/index", response_class=HTMLResponse)
-async def read_root(request: Request, db: Session = Depends(get_db)):
-    username = request.session.get("user")
-    if not username:
+async def read_root(request: Request):
+    payload = await get_current_user(request)
+    if payload is None:
         return RedirectResponse("/", status_code=302)
 
-    user = db.query(User).filter(User.username == username).first()
-    full_name = user.full_name if user else None
+    username = payload["sub"]
+    full_name = payload["name"]
 
-    food_items = db.query(FoodItem).all()
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "user": username,
-            "full_name": full_name,
-            "food_items": food_items,
-        },
+    await menu_cache.catalog.ensure_loaded_async()
+    food_items = menu_cache.catalog.items()
+    digest = menu_cache.catalog.digest
+
+    def render():
+        return templates.get_template("index.html").render(
+            user=username,
+            full_name=full_name,
+            food_cards=render_food_cards(food_items, digest),
+        )
+
+    entry = page_cache.render_cache.get_or_render(
+        ("index.html", digest, username, full_name), render
+    )
+    return page_cache.cached_html_response(
+        request, entry, menu_cache.catalog.updated_at, private=True
     )
 
 
-@app.get("/admin", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
-    username = request.session.get("user")
-    is_admin = request.session.get("is_admin")
-    if not username or not is_admin:
-        return RedirectResponse("/", status_code=302)
+# The food-card grid is shared by every user's /index, so it is rendered once
+# per menu version and embedded as a pre-rendered fragment
+def render_food_cards(food_items, digest):
+    html, _ = page_cache.render_cache.get_or_render(
+        ("food_cards.html", digest),
+        lambda: templates.get_template("food_cards.html").render(
+            food_items=food_items
+        ),
+    )
+    return Markup(html)
 
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not user.is_admin:
+
+@app.get("/admin", response_class=HTMLResponse)
+async def admin_dashboard(request: Request):
+    payload = await get_current_user(request)
+    if payload is None or payload["role"] != "admin":
         return RedirectResponse("/", status_code=302)
 
     return templates.TemplateResponse(
-        "admin_dashboard.html", {"request": request, "full_name": user.full_name}
+        "admin_dashboard.html", {"request": request, "full_name": payload["name"]}
     )
 
 
+# Revenue per day, best sellers and item ratings over [start, end], served
+# from the in-memory analytics read model (last 30 days by default)
+@app.get("/admin/analytics", dependencies=[Depends(admin_only)])
+async def admin_analytics(
+    start: date = None, end: date = None, limit: int = Query(10, ge=1, le=100)
+):
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days > 3660:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+    await analytics.model.refresh()
+    await menu_cache.catalog.ensure_loaded_async()
+    return analytics.model.summary(start, end, limit)
+
+
+# Invalidates every session of a user: this worker rejects them at once,
+# other workers when the tokens next expire and are re-checked
+@app.post(
+    "/admin/users/{user_id}/revoke-sessions", dependencies=[Depends(admin_only)]
+)
+async def revoke_user_sessions(user_id: int, db: AsyncSession = Depends(get_db)):
+    user = await db.get(User, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+    revoked_token_versions[user_id] = user.token_version
+    return {"user_id": user_id, "token_version": user.token_version}
+
+
+@app.get("/admin/pool-stats", dependencies=[Depends(admin_only)])
+async def pool_stats():
+    return db_helper.get_pool_stats()
+
+
+@app.get("/admin/session-store-stats", dependencies=[Depends(admin_only)])
+async def session_store_stats():
+    return await call_session_store(inprogress_orders.stats)
+
+
+@app.get("/admin/menu-cache-stats", dependencies=[Depends(admin_only)])
+async def menu_cache_stats():
+    return menu_cache.catalog.stats()
+
+
+# Prometheus scrape endpoint, guarded by METRICS_TOKEN when it is set
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(request: Request):
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != (
+        f"Bearer {metrics.METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/admin/order-status-stats", dependencies=[Depends(admin_only)])
+async def order_status_stats():
+    return order_status.cache.stats()
+
+
+@app.get("/admin/webhook-dedup-stats", dependencies=[Depends(admin_only)])
+async def webhook_dedup_stats():
+    return webhook_dedup.deduplicator.stats()
+
+
+@app.get("/admin/tracking-queue-stats", dependencies=[Depends(admin_only)])
+async def tracking_queue_stats():
+    return tracking_queue.writer.stats()
+
+
 @app.get("/create-food-item", response_class=HTMLResponse)
 async def create_food_item_form(request: Request):
-    admin_only(request)
+    await admin_only(request)
     return templates.TemplateResponse("create_food_item.html", {"request": request})
 
 
@@ -324,36 +804,111 @@ async def create_food_item(
     description: str = Form(None),
     price: float = Form(...),
     image_url: str = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    admin_only(request)
+    await admin_only(request)
     image_path = f"/static/images/{image_url}"
     new_food_item = FoodItem(
         name=name, description=description, price=price, image_url=image_path
     )
     db.add(new_food_item)
-    db.commit()
-    db.refresh(new_food_item)
+    await db.commit()
+    await db.refresh(new_food_item)
+    await run_in_threadpool(static_assets.add_image, image_path)
+    invalidate_menu()
     return RedirectResponse(url="/food-items", status_code=303)
 
 
 @app.post("/remove-food-item/{item_id}")
 async def remove_food_item(
-    request: Request, item_id: int, db: Session = Depends(get_db)
+    request: Request, item_id: int, db: AsyncSession = Depends(get_db)
 ):
-    admin_only(request)
-    food_item = db.query(FoodItem).filter(FoodItem.id == item_id).first()
+    await admin_only(request)
+    food_item = await db.get(FoodItem, item_id)
     if food_item:
-        db.delete(food_item)
-        db.commit()
+        await db.delete(food_item)
+        await db.commit()
+        invalidate_menu()
     return RedirectResponse(url="/food-items", status_code=303)
 
 
+# Bulk menu upload (CSV or JSONL), parsed and upserted in chunks off the loop
+@app.post("/admin/menu/import", dependencies=[Depends(admin_only)])
+async def import_menu(file: UploadFile = File(...), format: str = None):
+    fmt = format or menu_io.guess_format(file.filename)
+    try:
+        counts = await run_in_threadpool(menu_io.import_menu_file, file.file, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    invalidate_menu()
+    return counts
+
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def export_response(rows, name: str, fmt: str):
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    return StreamingResponse(
+        rows,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={name}.{fmt}"},
+    )
+
+
+@app.get("/admin/menu/export", dependencies=[Depends(admin_only)])
+async def export_menu(format: str = "csv"):
+    return export_response(menu_io.export_menu_async(format), "food_items", format)
+
+
+@app.get("/admin/orders/export", dependencies=[Depends(admin_only)])
+async def export_orders(format: str = "csv"):
+    return export_response(menu_io.export_orders_async(format), "orders", format)
+
+
+# JSON menu API. Plain listing and prefix search page by id (`after` is the
+# cursor returned as `next_after`); fuzzy search returns the best matches.
+@app.get("/api/food-items")
+async def api_food_items(
+    after: int = None,
+    limit: int = Query(20, ge=1, le=100),
+    available: bool = None,
+    min_price: float = None,
+    max_price: float = None,
+    q: str = None,
+    fuzzy: bool = False,
+):
+    await menu_cache.catalog.ensure_loaded_async()
+    if q and fuzzy:
+        matches = menu_cache.catalog.fuzzy_search(q, limit)
+        return {
+            "items": [dict(item._asdict(), score=score) for item, score in matches],
+            "next_after": None,
+        }
+    items, next_after = menu_cache.catalog.page(
+        after=after,
+        limit=limit,
+        available=available,
+        min_price=min_price,
+        max_price=max_price,
+        prefix=q,
+    )
+    return {"items": [item._asdict() for item in items], "next_after": next_after}
+
+
 @app.get("/food-items", response_class=HTMLResponse)
-def list_food_items(request: Request, db: Session = Depends(get_db)):
-    food_items = db.query(FoodItem).all()
-    return templates.TemplateResponse(
-        "food_items.html", {"request": request, "food_items": food_items}
+async def list_food_items(request: Request):
+    await menu_cache.catalog.ensure_loaded_async()
+    food_items = menu_cache.catalog.items()
+    entry = page_cache.render_cache.get_or_render(
+        ("food_items.html", menu_cache.catalog.digest),
+        lambda: templates.get_template("food_items.html").render(
+            food_items=food_items
+        ),
+    )
+    return page_cache.cached_html_response(
+        request, entry, menu_cache.catalog.updated_at
     )
 
 
@@ -369,13 +924,13 @@ async def create_user_form(request: Request):
 )
 async def create_user(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     username: str = Form(...),
     email: str = Form(...),
     full_name: str = Form(...),
     password: str = Form(...),
 ):
-    hashed_password = get_password_hash(password)
+    hashed_password = await password_helper.hash_password(password)
     new_user = User(
         username=username,
         email=email,
@@ -383,8 +938,8 @@ async def create_user(
         hashed_password=hashed_password,
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return RedirectResponse("/admin", status_code=302)
 
 
@@ -0,0 +1,134 @@
+import argparse
+import sys
+import db_helper
+import menu_io
+import recommendations
+import static_assets
+import template_cache
+
+
+def init_db(args):
+    db_helper.init_db()
+    print("Database tables created successfully!")
+
+
+def import_menu(args):
+    fmt = args.format or menu_io.guess_format(args.path)
+    with open(args.path, encoding="utf-8", newline="") as file:
+        counts = menu_io.import_menu_file(file, fmt)
+    print(
+        f"Imported menu: {counts['inserted']} inserted, {counts['updated']} updated, "
+        f"{counts['skipped']} skipped"
+    )
+
+
+def export_table(args):
+    query, fields = {
+        "export-menu": (menu_io.SELECT_MENU_EXPORT, menu_io.MENU_FIELDS),
+        "export-orders": (menu_io.SELECT_ORDERS_EXPORT, menu_io.ORDER_FIELDS),
+    }[args.command]
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in menu_io.iter_export(query, fields, args.format):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def create_order(args):
+    order_items = {}
+    for line in args.items:
+        name, _, quantity = line.rpartition("=")
+        if not name or not quantity.isdigit():
+            sys.exit(f"Expected NAME=QUANTITY, got {line!r}")
+        order_items[name] = order_items.get(name, 0) + int(quantity)
+    order_id, total = db_helper.save_order(order_items)
+    if order_id == -1:
+        sys.exit("Order was not saved")
+    print(f"Order {order_id} placed, total {total}")
+
+
+def build_static(args):
+    manifest = static_assets.build_all()
+    print(
+        f"Built {len(manifest['assets'])} assets and "
+        f"{len(manifest['thumbnails'])} image thumbnails into {static_assets.BUILD_DIR}"
+    )
+
+
+def compile_templates(args):
+    env = template_cache.create_environment(args.cache_dir)
+    names = template_cache.precompile(env)
+    print(f"Compiled {len(names)} templates into {env.bytecode_cache.directory}")
+
+
+def rebuild_recommendations(args):
+    counts = recommendations.engine.rebuild()
+    recommendations.engine.save(args.output)
+    print(
+        f"Counted {counts['pairs']} item pairs over {counts['items']} items, "
+        f"saved to {args.output}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatCuisine management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    init_db_parser = subparsers.add_parser(
+        "init-db", help="create all database tables (run once per database)"
+    )
+    init_db_parser.set_defaults(func=init_db)
+
+    import_parser = subparsers.add_parser(
+        "import-menu", help="upsert food items from a CSV or JSONL file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"])
+    import_parser.set_defaults(func=import_menu)
+
+    for command, help_text in (
+        ("export-menu", "stream all food items as CSV or JSONL"),
+        ("export-orders", "stream all orders as CSV or JSONL"),
+    ):
+        export_parser = subparsers.add_parser(command, help=help_text)
+        export_parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        export_parser.add_argument("--output", help="file to write (default: stdout)")
+        export_parser.set_defaults(func=export_table)
+
+    order_parser = subparsers.add_parser(
+        "create-order", help="place an order, e.g. for phone or counter orders"
+    )
+    order_parser.add_argument("items", nargs="+", metavar="NAME=QUANTITY")
+    order_parser.set_defaults(func=create_order)
+
+    build_static_parser = subparsers.add_parser(
+        "build-static",
+        help="fingerprint and pre-compress CSS/JS, build image thumbnails",
+    )
+    build_static_parser.set_defaults(func=build_static)
+
+    compile_templates_parser = subparsers.add_parser(
+        "compile-templates", help="fill the template bytecode cache ahead of time"
+    )
+    compile_templates_parser.add_argument(
+        "--cache-dir", default=template_cache.TEMPLATE_CACHE_DIR
+    )
+    compile_templates_parser.set_defaults(func=compile_templates)
+
+    recommendations_parser = subparsers.add_parser(
+        "rebuild-recommendations",
+        help="recount frequently-ordered-together pairs from order history",
+    )
+    recommendations_parser.add_argument(
+        "--output", default=recommendations.RECOMMENDATIONS_PATH
+    )
+    recommendations_parser.set_defaults(func=rebuild_recommendations)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import asyncio
+import bisect
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import text
+import db_helper
+from menu_search import MenuSearchIndex
+
+# Seconds a loaded menu is trusted before it is re-read. Admin edits on this
+# worker invalidate immediately, the TTL covers edits made on other workers.
+MENU_CACHE_TTL = float(os.getenv("MENU_CACHE_TTL", "60"))
+# Share of a spoken name's trigrams (0-1) a menu name must contain to match
+# at all, and the score from which the match is taken without asking
+FUZZY_MATCH_MIN_SCORE = float(os.getenv("FUZZY_MATCH_MIN_SCORE", "0.3"))
+FUZZY_MATCH_CONFIDENT_SCORE = float(os.getenv("FUZZY_MATCH_CONFIDENT_SCORE", "0.6"))
+
+# Spoken variants Dialogflow may send for a menu item, mapped to the menu name
+DEFAULT_SYNONYMS = {
+    "pav bhaji": "Pav Bhaji",
+    "chole bhature": "Chole Bhature",
+    "chhole bhature": "Chole Bhature",
+    "lassi": "Mango Lassi",
+    "mango lassi": "Mango Lassi",
+    "dosa": "Masala Dosa",
+    "masala dosa": "Masala Dosa",
+    "rava dosa": "Rava Dosa",
+    "biryani": "Vegetable Biryani",
+    "veg biryani": "Vegetable Biryani",
+    "vegetable biryani": "Vegetable Biryani",
+    "vada pav": "Vada Pav",
+    "samosa": "Samosa",
+    "pizza": "Pizza",
+}
+
+SELECT_MENU = text(
+    "SELECT id, name, description, price, available, image_url "
+    "FROM food_items ORDER BY id"
+)
+
+MenuItem = namedtuple(
+    "MenuItem", ["id", "name", "description", "price", "available", "image_url"]
+)
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+class MenuCatalog:
+    def __init__(self, ttl=MENU_CACHE_TTL, synonyms=None):
+        self.ttl = ttl
+        self.synonyms = {
+            normalize_name(key): normalize_name(value)
+            for key, value in (synonyms or DEFAULT_SYNONYMS).items()
+        }
+        self.version = 0
+        # Content hash of the loaded menu, identical on every worker serving
+        # the same data, and the wall-clock time it last changed
+        self.digest = None
+        self.updated_at = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._items = None
+        self._by_name = {}
+        self._by_id = {}
+        # Item ids in ascending order, the keyset for pagination
+        self._ids = []
+        self.search_index = MenuSearchIndex()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        # One async reload at a time, created on first use inside the loop
+        self._reload_lock = None
+
+    def _store(self, rows):
+        items = [MenuItem(*row) for row in rows]
+        digest = hashlib.sha1(repr(items).encode()).hexdigest()[:16]
+        if digest != self.digest:
+            self.digest = digest
+            self.updated_at = time.time()
+        by_id = {item.id: item for item in items}
+        self._update_search_index(by_id)
+        self._items = items
+        self._by_name = {normalize_name(item.name): item for item in items}
+        self._by_id = by_id
+        self._ids = [item.id for item in items]
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    # Applies only the added, renamed and removed items to the search index.
+    # The first load (or a bulk import) rebuilds it in one pass instead.
+    def _update_search_index(self, by_id):
+        previous = self._by_id
+        removed = [item_id for item_id in previous if item_id not in by_id]
+        changed = [
+            item
+            for item_id, item in by_id.items()
+            if item_id not in previous or previous[item_id].name != item.name
+        ]
+        if not previous or len(removed) + len(changed) > 1000:
+            self.search_index.rebuild((item.id, item.name) for item in by_id.values())
+            return
+        for item_id in removed:
+            self.search_index.remove(item_id)
+        for item in changed:
+            self.search_index.add(item.id, item.name)
+
+    def _load(self):
+        with db_helper.get_engine().connect() as connection:
+            rows = connection.execute(SELECT_MENU).fetchall()
+        self._store(rows)
+
+    def _is_fresh(self):
+        return self._items is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if not self._is_fresh():
+                self._load()
+
+    # Reloads a stale catalog without blocking the event loop. Async handlers
+    # await this before using the synchronous accessors below.
+    async def ensure_loaded_async(self):
+        if self._is_fresh():
+            return
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            # Requests that queued behind a reload find the catalog fresh
+            if self._is_fresh():
+                return
+            version = self.version
+            async with db_helper.get_async_engine().connect() as connection:
+                result = await connection.execute(SELECT_MENU)
+                rows = result.fetchall()
+            with self._lock:
+                # An admin edit during the query makes these rows stale already
+                if self.version == version:
+                    self._store(rows)
+
+    def invalidate(self):
+        with self._lock:
+            self._items = None
+            self.version += 1
+
+    def items(self):
+        self._ensure_loaded()
+        return self._items
+
+    def get(self, item_id):
+        self._ensure_loaded()
+        return self._by_id.get(item_id)
+
+    def lookup(self, name: str):
+        self._ensure_loaded()
+        key = normalize_name(name)
+        item = self._by_name.get(key)
+        if item is None and key in self.synonyms:
+            item = self._by_name.get(self.synonyms[key])
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return item
+
+    # Resolves food names through lookup; names without an exact or synonym
+    # match fall back to the menu item containing most of their trigrams, all
+    # of them scored in one batch. Returns {name: (item or None, score)}, exact
+    # matches score 1.0.
+    def resolve_scored(self, names, min_score=FUZZY_MATCH_MIN_SCORE):
+        resolved = dict.fromkeys(names)
+        misses = []
+        for name in resolved:
+            item = self.lookup(name)
+            if item is None:
+                misses.append(name)
+            else:
+                resolved[name] = (item, 1.0)
+        if misses:
+            with self._lock:
+                matches = self.search_index.best_matches(misses, min_score)
+            for name, (item_id, score) in zip(misses, matches):
+                resolved[name] = (self._by_id.get(item_id), score)
+        return resolved
+
+    # Keyset pagination over the menu in id order: returns up to `limit` items
+    # with id > `after` matching the filters, and the cursor for the next page
+    def page(
+        self,
+        after=None,
+        limit=20,
+        available=None,
+        min_price=None,
+        max_price=None,
+        prefix=None,
+    ):
+        self._ensure_loaded()
+        ids = self._ids
+        if prefix:
+            ids = sorted(self.search_index.prefix_search(prefix))
+        position = bisect.bisect_right(ids, after) if after is not None else 0
+
+        items = []
+        while position < len(ids) and len(items) <= limit:
+            item = self._by_id[ids[position]]
+            position += 1
+            if available is not None and bool(item.available) != available:
+                continue
+            if min_price is not None and item.price < min_price:
+                continue
+            if max_price is not None and item.price > max_price:
+                continue
+            items.append(item)
+
+        next_after = items[limit - 1].id if len(items) > limit else None
+        return items[:limit], next_after
+
+    # Typo-tolerant name search, returns [(item, score)] best match first
+    def fuzzy_search(self, query: str, limit=20):
+        self._ensure_loaded()
+        return [
+            (self._by_id[item_id], score)
+            for item_id, score in self.search_index.fuzzy_search(query, limit)
+        ]
+
+    def add_synonym(self, spoken: str, name: str):
+        self.synonyms[normalize_name(spoken)] = normalize_name(name)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "digest": self.digest,
+            "items": len(self._items or ()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+        }
+
+
+catalog = MenuCatalog()
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+from sqlalchemy import text, bindparam
+import db_helper
+
+# Rows per bulk statement, so memory stays constant whatever the file size
+MENU_IMPORT_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+MENU_FIELDS = ["id", "name", "description", "price", "available", "image_url"]
+ORDER_FIELDS = ["id", "user_id", "created_at", "total_amount", "status"]
+
+SELECT_IDS_BY_NAME = text(
+    "SELECT id, name FROM food_items WHERE name IN :names"
+).bindparams(bindparam("names", expanding=True))
+
+INSERT_FOOD_ITEM = text("""
+    INSERT INTO food_items (name, description, price, available, image_url)
+    VALUES (:name, :description, :price, :available, :image_url)
+""")
+
+UPDATE_FOOD_ITEM = text("""
+    UPDATE food_items
+    SET description = :description, price = :price, available = :available,
+        image_url = :image_url
+    WHERE id = :id
+""")
+
+SELECT_MENU_EXPORT = text(
+    "SELECT id, name, description, price, available, image_url "
+    "FROM food_items ORDER BY id"
+)
+
+SELECT_ORDERS_EXPORT = text("""
+    SELECT o.id, o.user_id, o.created_at, o.total_amount, t.status
+    FROM orders o LEFT JOIN order_tracking t ON t.order_id = o.id
+    ORDER BY o.id
+""")
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == "":
+        return True
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+# Function to lazily parse a CSV or JSONL menu from an iterable of text lines
+def iter_menu_rows(lines, fmt: str):
+    if fmt == "csv":
+        records = csv.DictReader(lines)
+    elif fmt == "jsonl":
+        records = (json.loads(line) for line in lines if line.strip())
+    else:
+        raise ValueError(f"Unsupported menu format: {fmt}")
+
+    for record in records:
+        name = (record.get("name") or "").strip()
+        price = record.get("price")
+        if not name or price in (None, ""):
+            yield None
+            continue
+        yield {
+            "name": name,
+            "description": record.get("description") or None,
+            "price": float(price),
+            "available": _parse_bool(record.get("available")),
+            "image_url": record.get("image_url") or None,
+        }
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Existing items are matched by name and updated, the rest are inserted.
+# food_items.name carries no unique key, so this stays portable instead of
+# relying on INSERT ... ON DUPLICATE KEY UPDATE.
+def _upsert_chunk(connection, chunk):
+    # Later rows of the same name win, like they would in sequential inserts
+    by_name = {row["name"]: row for row in chunk}
+    existing = {
+        row.name: row.id
+        for row in connection.execute(SELECT_IDS_BY_NAME, {"names": list(by_name)})
+    }
+    updates = [
+        dict(row, id=existing[name]) for name, row in by_name.items() if name in existing
+    ]
+    inserts = [row for name, row in by_name.items() if name not in existing]
+    if updates:
+        connection.execute(UPDATE_FOOD_ITEM, updates)
+    if inserts:
+        connection.execute(INSERT_FOOD_ITEM, inserts)
+    return len(inserts), len(updates)
+
+
+# Function to upsert a stream of menu rows in chunked bulk statements.
+# Each chunk commits on its own so a bad row late in a huge file doesn't
+# roll back everything before it.
+def import_menu(rows, chunk_size=MENU_IMPORT_CHUNK_SIZE) -> dict:
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    valid_rows = _count_skipped(rows, counts)
+    for chunk in _chunks(valid_rows, chunk_size):
+        with db_helper.get_engine().begin() as connection:
+            inserted, updated = _upsert_chunk(connection, chunk)
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+    return counts
+
+
+def _count_skipped(rows, counts):
+    for row in rows:
+        if row is None:
+            counts["skipped"] += 1
+        else:
+            yield row
+
+
+# Function to import a menu file object (binary or text) in CSV or JSONL
+def import_menu_file(file, fmt: str) -> dict:
+    if isinstance(file, io.TextIOBase):
+        lines = file
+    else:
+        lines = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    return import_menu(iter_menu_rows(lines, fmt))
+
+
+def guess_format(filename: str) -> str:
+    return "jsonl" if filename and filename.lower().endswith((".jsonl", ".json")) else "csv"
+
+
+def _format_rows(rows, fields, fmt: str):
+    if fmt == "jsonl":
+        return "".join(
+            json.dumps(dict(zip(fields, row)), default=str) + "\n" for row in rows
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _header(fields, fmt: str):
+    return ",".join(fields) + "\r\n" if fmt == "csv" else ""
+
+
+# Function to stream a table export with a server-side cursor, yielding one
+# formatted batch at a time (used by the manage.py CLI)
+def iter_export(query, fields, fmt: str):
+    yield _header(fields, fmt)
+    with db_helper.get_engine().connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(query)
+        for rows in result.partitions():
+            yield _format_rows(rows, fields, fmt)
+
+
+# Async counterpart of iter_export for StreamingResponse
+async def iter_export_async(query, fields, fmt: str):
+    yield _header(fields, fmt)
+    async with db_helper.get_async_engine().connect() as connection:
+        result = await connection.stream(
+            query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            yield _format_rows(rows, fields, fmt)
+
+
+def export_menu_async(fmt: str):
+    return iter_export_async(SELECT_MENU_EXPORT, MENU_FIELDS, fmt)
+
+
+def export_orders_async(fmt: str):
+    return iter_export_async(SELECT_ORDERS_EXPORT, ORDER_FIELDS, fmt)
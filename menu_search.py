@@ -0,0 +1,200 @@
+import bisect
+from array import array
+from collections import defaultdict
+import numpy as np
+
+# Overlaps are counted densely once the posting lists hold more than one
+# entry per this many (query, item) cells
+DENSE_COUNT_RATIO = 8
+
+
+def normalize_text(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def trigrams(value: str) -> set:
+    padded = f"  {normalize_text(value)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+# Name search over the menu: a sorted word list for prefix queries and a
+# trigram inverted index for typo-tolerant ones. Both are updated one item at
+# a time, so a menu edit never rebuilds the whole index.
+class MenuSearchIndex:
+    def __init__(self):
+        # Sorted (word, item_id) pairs, every word of every name
+        self._words = []
+        # trigram -> ids of items whose name contains it. Compact arrays rather
+        # than sets keep 100k-item menus to a few bytes per posting.
+        self._trigrams = defaultdict(lambda: array("I"))
+        # item_id -> (indexed name, trigram count), the name is re-tokenized
+        # on removal instead of keeping every token set in memory
+        self._indexed = {}
+        # item_id -> trigram count, as an array for batched scoring (0 = absent)
+        self._gram_counts = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self._indexed)
+
+    def add(self, item_id: int, name: str):
+        if item_id in self._indexed:
+            self.remove(item_id)
+        grams = trigrams(name)
+        for word in set(normalize_text(name).split()):
+            bisect.insort(self._words, (word, item_id))
+        for gram in grams:
+            self._trigrams[gram].append(item_id)
+        self._indexed[item_id] = (name, len(grams))
+        self._set_gram_count(item_id, len(grams))
+
+    def _set_gram_count(self, item_id: int, count: int):
+        if item_id >= len(self._gram_counts):
+            grown = np.zeros(
+                max(item_id + 1, 2 * len(self._gram_counts)), dtype=np.float32
+            )
+            grown[: len(self._gram_counts)] = self._gram_counts
+            self._gram_counts = grown
+        self._gram_counts[item_id] = count
+
+    # Replaces the whole index in one pass, sorting the word list once
+    # instead of inserting into it item by item
+    def rebuild(self, items):
+        self._words = []
+        self._trigrams = defaultdict(lambda: array("I"))
+        self._indexed = {}
+        for item_id, name in items:
+            grams = trigrams(name)
+            self._words.extend(
+                (word, item_id) for word in set(normalize_text(name).split())
+            )
+            for gram in grams:
+                self._trigrams[gram].append(item_id)
+            self._indexed[item_id] = (name, len(grams))
+        self._words.sort()
+        self._gram_counts = np.zeros(max(self._indexed, default=-1) + 1, np.float32)
+        for item_id, (_, count) in self._indexed.items():
+            self._gram_counts[item_id] = count
+
+    def remove(self, item_id: int):
+        indexed = self._indexed.pop(item_id, None)
+        if indexed is None:
+            return
+        name = indexed[0]
+        self._gram_counts[item_id] = 0
+        for word in set(normalize_text(name).split()):
+            position = bisect.bisect_left(self._words, (word, item_id))
+            if position < len(self._words) and self._words[position] == (word, item_id):
+                del self._words[position]
+        for gram in trigrams(name):
+            ids = self._trigrams.get(gram)
+            if ids is not None and item_id in ids:
+                ids.remove(item_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    # Ids of items where every query word prefixes some word of the name
+    def prefix_search(self, query: str) -> set:
+        result = None
+        for term in normalize_text(query).split():
+            position = bisect.bisect_left(self._words, (term,))
+            matches = set()
+            while position < len(self._words):
+                word, item_id = self._words[position]
+                if not word.startswith(term):
+                    break
+                matches.add(item_id)
+                position += 1
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result or set()
+
+    # Scores every (query, item) pair sharing at least one trigram, as arrays
+    # (query positions, item ids, scores) sorted by query, then item id. The
+    # score is the share of the query's trigrams found in the name, so a short
+    # or partial spoken name ("lasi") still scores high against a longer menu
+    # name ("Mango Lassi"). The queries' posting lists are concatenated and the overlaps
+    # counted in one pass: by sorting when the lists are short, or with a
+    # dense bincount when common trigrams make them long.
+    def _score(self, queries):
+        width = len(self._gram_counts)
+        query_sizes = np.zeros(len(queries), dtype=np.float64)
+        postings = []
+        for position, query in enumerate(queries):
+            grams = trigrams(query)
+            query_sizes[position] = len(grams)
+            for gram in grams:
+                ids = self._trigrams.get(gram)
+                if ids:
+                    postings.append(
+                        np.frombuffer(ids, dtype=np.uint32).astype(np.int64)
+                        + position * width
+                    )
+        if not postings:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float64)
+
+        keys = np.concatenate(postings)
+        if len(keys) * DENSE_COUNT_RATIO > len(queries) * width:
+            counts = np.bincount(keys, minlength=len(queries) * width)
+            pairs = np.flatnonzero(counts)
+            overlaps = counts[pairs].astype(np.float64)
+        else:
+            keys.sort()
+            runs = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            pairs = keys[runs]
+            overlaps = np.diff(np.r_[runs, len(keys)]).astype(np.float64)
+        positions, item_ids = np.divmod(pairs, width)
+        return positions, item_ids, overlaps / query_sizes[positions]
+
+    # Returns [(item_id, score)] best first, score being the share of the
+    # query's trigrams in the name. Equal scores rank the shorter name first.
+    def fuzzy_search(self, query: str, limit=20, min_score=0.3) -> list:
+        _, item_ids, scores = self._score([query])
+        scores = np.round(scores, 3)
+        keep = np.flatnonzero(scores >= min_score)
+        if len(keep) > limit:
+            # Everything tied with the limit-th score stays in the running
+            cutoff = -np.partition(-scores[keep], limit - 1)[limit - 1]
+            keep = keep[scores[keep] >= cutoff]
+        # Ties on score go to the name with fewer trigrams, then the lower id
+        keep = keep[
+            np.lexsort(
+                (item_ids[keep], self._gram_counts[item_ids[keep]], -scores[keep])
+            )
+        ][:limit]
+        return list(zip(item_ids[keep].tolist(), scores[keep].tolist()))
+
+    # Best match for each query in one batch, as [(item_id or None, score)]
+    def best_matches(self, queries, min_score=0.3) -> list:
+        matches = [(None, 0.0)] * len(queries)
+        positions, item_ids, scores = self._score(queries)
+        if not len(scores):
+            return matches
+
+        starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]])
+        best_scores = np.maximum.reduceat(scores, starts)
+        segment = np.repeat(
+            np.arange(len(starts)), np.diff(np.r_[starts, len(scores)])
+        )
+        # Of the items reaching their query's best score, the one with the
+        # fewest trigrams (closest to the query's length), then the lowest id
+        winners = np.flatnonzero(scores == best_scores[segment])
+        winners = winners[
+            np.lexsort(
+                (
+                    item_ids[winners],
+                    self._gram_counts[item_ids[winners]],
+                    segment[winners],
+                )
+            )
+        ]
+        winners = winners[np.r_[True, segment[winners[1:]] != segment[winners[:-1]]]]
+        for position, item_id, score in zip(
+            positions[winners].tolist(),
+            item_ids[winners].tolist(),
+            scores[winners].tolist(),
+        ):
+            if score >= min_score:
+                matches[position] = (item_id, round(score, 3))
+        return matches
@@ -0,0 +1,259 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+
+# Fraction of requests whose DB and template time is attributed to their
+# route. Request counts and latencies are always recorded.
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+# Statements slower than this are logged, with their bound parameters unless
+# SLOW_QUERY_LOG_PARAMS=0 (they may hold personal data)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_LOG_PARAMS = os.getenv("SLOW_QUERY_LOG_PARAMS", "1") == "1"
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+slow_query_logger = logging.getLogger("chatcuisine.slow_query")
+
+
+# Per-request totals, only allocated for sampled requests
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "pool_wait_seconds", "render_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+_current_request = contextvars.ContextVar("current_request_stats", default=None)
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels: tuple, amount=1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} counter")
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+
+
+class HistogramMetric:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                bucket_labels = _labels(
+                    self.label_names + ("le",), labels + (str(bound),)
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = HistogramMetric(
+            "chatcuisine_request_duration_seconds",
+            "HTTP request latency",
+            ("method", "route", "status"),
+            LATENCY_BUCKETS,
+        )
+        self.request_queries = HistogramMetric(
+            "chatcuisine_request_db_queries",
+            "DB statements per sampled request",
+            ("route",),
+            QUERY_COUNT_BUCKETS,
+        )
+        self.query_seconds = CounterMetric(
+            "chatcuisine_db_query_seconds_total",
+            "Time spent executing DB statements in sampled requests",
+            ("route",),
+        )
+        self.pool_wait_seconds = CounterMetric(
+            "chatcuisine_db_pool_wait_seconds_total",
+            "Time sampled requests waited for a pooled DB connection",
+            ("route",),
+        )
+        self.render_seconds = CounterMetric(
+            "chatcuisine_template_render_seconds_total",
+            "Time spent rendering Jinja templates in sampled requests",
+            ("route",),
+        )
+        self.sampled_requests = CounterMetric(
+            "chatcuisine_sampled_requests_total",
+            "Requests whose DB and template time was recorded",
+            ("route",),
+        )
+        self.slow_queries = CounterMetric(
+            "chatcuisine_slow_queries_total",
+            f"DB statements slower than {SLOW_QUERY_THRESHOLD_MS} ms",
+            (),
+        )
+
+    def record_request(self, method, route, status, seconds, stats):
+        with self._lock:
+            self.request_duration.observe((method, route, str(status)), seconds)
+            if stats is not None:
+                self.sampled_requests.inc((route,))
+                self.request_queries.observe((route,), stats.queries)
+                self.query_seconds.inc((route,), stats.query_seconds)
+                self.pool_wait_seconds.inc((route,), stats.pool_wait_seconds)
+                self.render_seconds.inc((route,), stats.render_seconds)
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries.inc(())
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in (
+                self.request_duration,
+                self.sampled_requests,
+                self.request_queries,
+                self.query_seconds,
+                self.pool_wait_seconds,
+                self.render_seconds,
+                self.slow_queries,
+            ):
+                metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Pure ASGI middleware, so streaming responses and long-polls pass through
+# untouched. Routes are labelled by their path template to bound cardinality.
+class MetricsMiddleware:
+    def __init__(self, app, sample_rate=METRICS_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        stats = RequestStats() if sampled else None
+        token = _current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_request.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            registry.record_request(scope["method"], route, status, elapsed, stats)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        registry.record_slow_query()
+        bound = repr(parameters)[:500] if SLOW_QUERY_LOG_PARAMS else "[hidden]"
+        slow_query_logger.warning(
+            "Slow query (%.1f ms): %s; parameters: %s",
+            elapsed * 1000,
+            " ".join(statement.split()),
+            bound,
+        )
+
+
+# A failed statement never reaches after_cursor_execute
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_time"):
+        connection.info["query_start_time"].pop()
+
+
+# Called by db_helper for every engine it creates (async engines pass their
+# sync_engine, where cursor events fire)
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def record_pool_wait(seconds: float):
+    stats = _current_request.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def record_render(seconds: float):
+    stats = _current_request.get()
+    if stats is not None:
+        stats.render_seconds += seconds
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+import db_helper
+
+# Seconds a cached status is trusted. Updates made through this worker are
+# pushed into the cache immediately, the TTL covers the other workers.
+ORDER_STATUS_TTL = float(os.getenv("ORDER_STATUS_TTL", "5"))
+ORDER_STATUS_CACHE_SIZE = int(os.getenv("ORDER_STATUS_CACHE_SIZE", "10000"))
+# Upper bound on how long a long-poll request may be held open
+ORDER_STATUS_MAX_WAIT = float(os.getenv("ORDER_STATUS_MAX_WAIT", "30"))
+
+
+class OrderStatusCache:
+    def __init__(self, ttl=ORDER_STATUS_TTL, max_entries=ORDER_STATUS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        # order_id -> (status or None when the order doesn't exist, fetched_at)
+        self._statuses = OrderedDict()
+        # order_id -> (asyncio.Event set on the next publish, waiter count)
+        self._waiters = {}
+
+    def _cached(self, order_id):
+        entry = self._statuses.get(order_id)
+        if entry is None or time.monotonic() - entry[1] >= self.ttl:
+            return False, None
+        return True, entry[0]
+
+    def _store(self, order_id, status):
+        self._statuses[order_id] = (status, time.monotonic())
+        self._statuses.move_to_end(order_id)
+        while len(self._statuses) > self.max_entries:
+            self._statuses.popitem(last=False)
+
+    async def get_many(self, order_ids) -> dict:
+        statuses = {}
+        missing = []
+        for order_id in order_ids:
+            found, status = self._cached(order_id)
+            if found:
+                self.hits += 1
+                statuses[order_id] = status
+            else:
+                self.misses += 1
+                missing.append(order_id)
+
+        if missing:
+            # All misses of the batch are fetched with one query
+            self.queries += 1
+            fetched = await db_helper.get_order_statuses_async(missing)
+            if fetched is None:
+                # Errors are not cached, the next lookup retries
+                fetched = {}
+            else:
+                for order_id in missing:
+                    self._store(order_id, fetched.get(order_id))
+            for order_id in missing:
+                statuses[order_id] = fetched.get(order_id)
+        return statuses
+
+    async def get(self, order_id):
+        return (await self.get_many([order_id]))[order_id]
+
+    # Called whenever this worker writes order_tracking, wakes up long-polls
+    def publish(self, order_id, status):
+        self._store(order_id, status)
+        waiter = self._waiters.pop(order_id, None)
+        if waiter is not None:
+            waiter[0].set()
+
+    def invalidate(self, order_id):
+        self._statuses.pop(order_id, None)
+
+    # Waits until the order's status differs from `since` or `timeout` passes,
+    # then returns the current status. Changes made by other workers are
+    # picked up by re-reading once per TTL.
+    async def wait_for_change(self, order_id, since, timeout):
+        deadline = time.monotonic() + min(timeout, ORDER_STATUS_MAX_WAIT)
+        while True:
+            status = await self.get(order_id)
+            remaining = deadline - time.monotonic()
+            if status != since or remaining <= 0:
+                return status
+            event, waiting = self._waiters.get(order_id, (asyncio.Event(), 0))
+            self._waiters[order_id] = (event, waiting + 1)
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, self.ttl))
+            except asyncio.TimeoutError:
+                self.invalidate(order_id)
+            finally:
+                self._release_waiter(order_id, event)
+
+    def _release_waiter(self, order_id, event):
+        current = self._waiters.get(order_id)
+        if current is None or current[0] is not event:
+            return
+        if current[1] <= 1:
+            del self._waiters[order_id]
+        else:
+            self._waiters[order_id] = (event, current[1] - 1)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._statuses),
+            "hits": self.hits,
+            "misses": self.misses,
+            "queries": self.queries,
+            "waiting_orders": len(self._waiters),
+        }
+
+
+cache = OrderStatusCache()
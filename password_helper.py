@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+# bcrypt cost factor. Raising it rehashes each user's password on their next
+# successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so a few threads keep hashing off the event loop
+# while capping how much CPU a login burst can take
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Failed logins allowed per username within the window before verify is skipped
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+
+# Password hashing context
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+
+
+# Returns (valid, new_hash). new_hash is set when the stored hash uses an
+# outdated scheme or cost factor and should be saved in its place.
+async def verify_and_update(plain_password: str, hashed_password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, pwd_context.hash, password)
+
+
+# Sliding-window counter of failed logins per username. Usernames are kept in
+# LRU order so the table stays bounded under a spray of random usernames.
+class LoginRateLimiter:
+    def __init__(
+        self,
+        max_failures=LOGIN_MAX_FAILURES,
+        window=LOGIN_FAILURE_WINDOW,
+        max_usernames=10000,
+    ):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_usernames = max_usernames
+        self.blocked = 0
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, username: str, now: float):
+        failures = self._failures.get(username)
+        if failures is None:
+            return None
+        while failures and now - failures[0] > self.window:
+            failures.popleft()
+        return failures
+
+    # Reserves an attempt before the password is verified. It counts as a
+    # failure until reset() on success, so a burst of concurrent attempts
+    # can't all get past the check while the first verifies are running.
+    def allow(self, username: str) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            failures = self._recent(username, now)
+            if failures is None:
+                failures = self._failures[username] = deque(maxlen=self.max_failures)
+            if len(failures) >= self.max_failures:
+                self.blocked += 1
+                return False
+            failures.append(now)
+            self._failures.move_to_end(username)
+            while len(self._failures) > self.max_usernames:
+                self._failures.popitem(last=False)
+            return True
+
+    def reset(self, username: str):
+        with self._lock:
+            self._failures.pop(username, None)
+
+
+login_limiter = LoginRateLimiter()
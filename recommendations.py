@@ -0,0 +1,268 @@
+import heapq
+import math
+import os
+import threading
+import numpy as np
+from sqlalchemy import text
+import db_helper
+
+# Co-occurrence counts kept per item. A row is pruned back to its strongest
+# pairs once it doubles, so memory stays under items x 2 x neighbors counts
+# (1M for a 10k-item menu) however long the order history is.
+RECOMMENDATION_NEIGHBORS = int(os.getenv("RECOMMENDATION_NEIGHBORS", "50"))
+# Orders a pair must share before it is suggested
+RECOMMENDATION_MIN_SUPPORT = int(os.getenv("RECOMMENDATION_MIN_SUPPORT", "2"))
+# Written by `manage.py rebuild-recommendations`, loaded at startup
+RECOMMENDATIONS_PATH = os.getenv(
+    "RECOMMENDATIONS_PATH", "/tmp/chatcuisine_recommendations.npz"
+)
+# Without a saved model, rebuild from order history at startup. Off by default
+# on serverless, where every cold start would scan all of order_items.
+RECOMMENDATIONS_REBUILD_ON_STARTUP = (
+    os.getenv(
+        "RECOMMENDATIONS_REBUILD_ON_STARTUP", "0" if db_helper.DB_SERVERLESS else "1"
+    )
+    == "1"
+)
+REBUILD_BATCH_SIZE = 100000
+# Distinct pairs held while rebuilding; past this, pairs seen fewer than
+# RECOMMENDATION_MIN_SUPPORT times so far are dropped (80 MB of arrays)
+REBUILD_MAX_PAIRS = 5_000_000
+# Only the first items of larger orders are paired, so one catering order
+# can't add millions of pairs
+MAX_ITEMS_PER_ORDER = 50
+TOP_K_CACHED = 10
+
+SELECT_ORDER_LINES = text(
+    "SELECT order_id, food_item_id FROM order_items ORDER BY order_id, food_item_id"
+)
+
+
+# Function to expand (order_id, item_id) rows sorted by order into every
+# ordered (item, other item) pair within the same order, without Python loops
+def order_pairs(order_ids: np.ndarray, item_ids: np.ndarray):
+    if len(order_ids) == 0:
+        return item_ids[:0], item_ids[:0]
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_ids)])
+    # Row i is paired with every row of its order: repeat it size-of-order times
+    repeats = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(order_ids)), repeats)
+    first_in_order = np.repeat(np.repeat(starts, sizes), repeats)
+    position = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = first_in_order + position
+    keep = left != right
+    return item_ids[left[keep]], item_ids[right[keep]]
+
+
+class CooccurrenceEngine:
+    def __init__(self, neighbors=RECOMMENDATION_NEIGHBORS):
+        self.neighbors = neighbors
+        # item_id -> number of orders containing it
+        self._item_orders = {}
+        # item_id -> {other item_id: orders containing both}
+        self._pairs = {}
+        # item_id -> [(score, other item_id)] best first, dropped on change
+        self._top = {}
+        # Orders recorded while a rebuild reads history, replayed onto its counts
+        self._recorded = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._item_orders)
+
+    def _prune(self, item_id):
+        row = self._pairs[item_id]
+        if len(row) > 2 * self.neighbors:
+            keep = heapq.nlargest(self.neighbors, row.items(), key=lambda p: p[1])
+            self._pairs[item_id] = dict(keep)
+
+    # Caller holds the lock
+    def _count_order(self, item_ids):
+        for item_id in item_ids:
+            self._item_orders[item_id] = self._item_orders.get(item_id, 0) + 1
+            row = self._pairs.setdefault(item_id, {})
+            for other in item_ids:
+                if other != item_id:
+                    row[other] = row.get(other, 0) + 1
+            self._prune(item_id)
+            self._top.pop(item_id, None)
+
+    # Called when an order completes
+    def record_order(self, item_ids):
+        item_ids = sorted(set(item_ids))[:MAX_ITEMS_PER_ORDER]
+        with self._lock:
+            self._count_order(item_ids)
+            if self._recorded is not None:
+                self._recorded.append(item_ids)
+
+    # Cosine similarity of the items' order sets, so best sellers don't top
+    # every list just for being everywhere
+    def _top_for(self, item_id):
+        top = self._top.get(item_id)
+        if top is None:
+            row = self._pairs.get(item_id, {})
+            orders = self._item_orders.get(item_id, 0)
+            top = heapq.nlargest(
+                TOP_K_CACHED,
+                (
+                    (count / math.sqrt(orders * self._item_orders[other]), other)
+                    for other, count in row.items()
+                    if count >= RECOMMENDATION_MIN_SUPPORT
+                ),
+            )
+            self._top[item_id] = top
+        return top
+
+    # Returns up to k item ids that are often ordered with the cart's items,
+    # best first. `allowed` filters candidates, e.g. to available items.
+    def suggest(self, cart_item_ids, k=1, allowed=None) -> list:
+        cart = set(cart_item_ids)
+        scores = {}
+        with self._lock:
+            for item_id in cart:
+                for score, other in self._top_for(item_id):
+                    if other not in cart:
+                        scores[other] = scores.get(other, 0.0) + score
+        ranked = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))
+        return [
+            item_id for item_id, _ in ranked if allowed is None or allowed(item_id)
+        ][:k]
+
+    def _load_arrays(self, item_ids, item_orders, first, second, counts, replay=False):
+        item_orders_map = dict(zip(item_ids.tolist(), item_orders.tolist()))
+        pairs = {}
+        for a, b, count in zip(first.tolist(), second.tolist(), counts.tolist()):
+            pairs.setdefault(a, {})[b] = count
+        for item_id, row in pairs.items():
+            if len(row) > self.neighbors:
+                pairs[item_id] = dict(
+                    heapq.nlargest(self.neighbors, row.items(), key=lambda p: p[1])
+                )
+        with self._lock:
+            self._item_orders = item_orders_map
+            self._pairs = pairs
+            self._top = {}
+            if replay:
+                for recorded in self._recorded or ():
+                    self._count_order(recorded)
+                self._recorded = None
+
+    # Function to rebuild every count from order history, reading order_items
+    # in batches and counting pairs with NumPy. Orders are never split across
+    # batches: the last, possibly partial order is carried into the next one.
+    def rebuild(self, batch_size=REBUILD_BATCH_SIZE):
+        pair_keys = np.empty(0, dtype=np.int64)
+        pair_counts = np.empty(0, dtype=np.int64)
+        item_keys = np.empty(0, dtype=np.int64)
+        item_counts = np.empty(0, dtype=np.int64)
+        carry = np.empty((0, 2), dtype=np.int64)
+
+        def accumulate(rows):
+            nonlocal pair_keys, pair_counts, item_keys, item_counts
+            # (order_id, food_item_id) is the primary key, rows are unique
+            order_ids, item_ids = rows[:, 0], rows[:, 1]
+            starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+            rank = np.arange(len(order_ids)) - np.repeat(
+                starts, np.diff(np.r_[starts, len(order_ids)])
+            )
+            capped = rank < MAX_ITEMS_PER_ORDER
+            order_ids, item_ids = order_ids[capped], item_ids[capped]
+
+            first, second = order_pairs(order_ids, item_ids)
+            keys, counts = np.unique(first * (1 << 32) + second, return_counts=True)
+            pair_keys, pair_counts = _merge_counts(pair_keys, pair_counts, keys, counts)
+            if len(pair_keys) > REBUILD_MAX_PAIRS:
+                frequent = pair_counts >= RECOMMENDATION_MIN_SUPPORT
+                pair_keys, pair_counts = pair_keys[frequent], pair_counts[frequent]
+            keys, counts = np.unique(item_ids, return_counts=True)
+            item_keys, item_counts = _merge_counts(item_keys, item_counts, keys, counts)
+
+        # Orders completing from here on may be missing from the history read
+        with self._lock:
+            self._recorded = []
+        try:
+            with db_helper.get_engine().connect() as connection:
+                result = connection.execution_options(yield_per=batch_size).execute(
+                    SELECT_ORDER_LINES
+                )
+                for rows in result.partitions():
+                    batch = np.vstack([carry, np.asarray(rows, dtype=np.int64)])
+                    last_order = batch[-1, 0]
+                    split = np.searchsorted(batch[:, 0], last_order, "left")
+                    carry = batch[split:]
+                    if split:
+                        accumulate(batch[:split])
+            if len(carry):
+                accumulate(carry)
+        except BaseException:
+            with self._lock:
+                self._recorded = None
+            raise
+
+        self._load_arrays(
+            item_keys,
+            item_counts,
+            pair_keys >> 32,
+            pair_keys & 0xFFFFFFFF,
+            pair_counts,
+            replay=True,
+        )
+        return {"items": len(item_keys), "pairs": len(pair_keys)}
+
+    def save(self, path=RECOMMENDATIONS_PATH):
+        with self._lock:
+            first, second, counts = [], [], []
+            for a, row in self._pairs.items():
+                for b, count in row.items():
+                    first.append(a)
+                    second.append(b)
+                    counts.append(count)
+            item_ids = list(self._item_orders)
+            item_orders = [self._item_orders[item_id] for item_id in item_ids]
+        with open(path, "wb") as file:
+            np.savez_compressed(
+                file,
+                item_ids=np.asarray(item_ids, dtype=np.int64),
+                item_orders=np.asarray(item_orders, dtype=np.int64),
+                first=np.asarray(first, dtype=np.int64),
+                second=np.asarray(second, dtype=np.int64),
+                counts=np.asarray(counts, dtype=np.int64),
+            )
+
+    # Returns False when there is no saved model at `path`
+    def load(self, path=RECOMMENDATIONS_PATH) -> bool:
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                self._load_arrays(
+                    data["item_ids"],
+                    data["item_orders"],
+                    data["first"],
+                    data["second"],
+                    data["counts"],
+                )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Could not load recommendations from {path}: {e}")
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "items": len(self._item_orders),
+            "pairs": sum(len(row) for row in self._pairs.values()),
+        }
+
+
+# Function to add two sorted (key, count) arrays, keys stay unique and sorted
+def _merge_counts(keys, counts, new_keys, new_counts):
+    if not len(keys):
+        return new_keys, new_counts
+    all_keys = np.concatenate([keys, new_keys])
+    all_counts = np.concatenate([counts, new_counts])
+    merged_keys, inverse = np.unique(all_keys, return_inverse=True)
+    return merged_keys, np.bincount(inverse, weights=all_counts).astype(np.int64)
+
+
+engine = CooccurrenceEngine()
@@ -0,0 +1,283 @@
+import abc
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Abandoned Dialogflow sessions are dropped after this many idle seconds
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+# Upper bound on in-progress orders kept by the in-memory backend
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100000"))
+# The SQLite backend deletes every expired session once per this many writes
+SESSION_PURGE_EVERY = int(os.getenv("SESSION_PURGE_EVERY", "1000"))
+
+
+# In-progress orders keyed by Dialogflow session id. Every operation is atomic
+# for a single session, so a backend can be shared by several workers.
+class SessionOrderStore(abc.ABC):
+    # True when operations do blocking I/O and belong off the event loop
+    blocking = False
+
+    @abc.abstractmethod
+    def get(self, session_id: str):
+        pass
+
+    # Merges food_dict into the session's order and returns the order
+    @abc.abstractmethod
+    def add(self, session_id: str, food_dict: dict) -> dict:
+        pass
+
+    # Returns (removed, missing, remaining), or None for unknown sessions
+    @abc.abstractmethod
+    def remove(self, session_id: str, food_items: list):
+        pass
+
+    # Pops and returns the session's order, or None for unknown sessions
+    @abc.abstractmethod
+    def complete(self, session_id: str):
+        pass
+
+    def __contains__(self, session_id: str):
+        return self.get(session_id) is not None
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        pass
+
+
+def _split_removal(order: dict, food_items: list):
+    removed = []
+    missing = []
+    for item in food_items:
+        if item in order:
+            removed.append(item)
+            del order[item]
+        else:
+            missing.append(item)
+    return removed, missing
+
+
+# Process-local LRU store with idle expiry and a cap on session count
+class MemorySessionOrderStore(SessionOrderStore):
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evicted = 0
+        self.expired = 0
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, session_id: str):
+        # Returns the live order for the session, dropping it if it expired
+        entry = self._orders.get(session_id)
+        if entry is None:
+            return None
+        order, last_seen = entry
+        now = time.monotonic()
+        if now - last_seen > self.ttl:
+            del self._orders[session_id]
+            self.expired += 1
+            return None
+        self._orders[session_id] = (order, now)
+        self._orders.move_to_end(session_id)
+        return order
+
+    def _evict(self):
+        now = time.monotonic()
+        # Oldest entries sit at the front, so expiry stops at the first live one
+        while self._orders:
+            session_id, (_, last_seen) = next(iter(self._orders.items()))
+            if now - last_seen <= self.ttl:
+                break
+            self._orders.popitem(last=False)
+            self.expired += 1
+        while len(self._orders) > self.max_sessions:
+            self._orders.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, session_id: str):
+        with self._lock:
+            order = self._touch(session_id)
+            return dict(order) if order is not None else None
+
+    def add(self, session_id: str, food_dict: dict) -> dict:
+        with self._lock:
+            order = self._touch(session_id)
+            if order is None:
+                order = {}
+                self._orders[session_id] = (order, time.monotonic())
+            order.update(food_dict)
+            self._evict()
+            return dict(order)
+
+    def remove(self, session_id: str, food_items: list):
+        with self._lock:
+            order = self._touch(session_id)
+            if order is None:
+                return None
+            removed, missing = _split_removal(order, food_items)
+            return removed, missing, dict(order)
+
+    def complete(self, session_id: str):
+        with self._lock:
+            order = self._touch(session_id)
+            if order is None:
+                return None
+            del self._orders[session_id]
+            return order
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._orders),
+                "max_sessions": self.max_sessions,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+# Store backed by a SQLite file, shared by every worker on the host. Waiting
+# for another worker's write lock can take up to the 30 s busy timeout.
+class SQLiteSessionOrderStore(SessionOrderStore):
+    blocking = True
+
+    def __init__(self, path: str, ttl=SESSION_TTL, purge_every=SESSION_PURGE_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self.expired = 0
+        self.purges = 0
+        self._writes = itertools.count(1)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS inprogress_orders ("
+                "session_id TEXT PRIMARY KEY, items TEXT NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_inprogress_orders_updated_at "
+                "ON inprogress_orders (updated_at)"
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return _Transaction(connection)
+
+    def _load(self, connection, session_id: str):
+        row = connection.execute(
+            "SELECT items, updated_at FROM inprogress_orders WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl:
+            connection.execute(
+                "DELETE FROM inprogress_orders WHERE session_id = ?", (session_id,)
+            )
+            self.expired += 1
+            return None
+        return json.loads(row[0])
+
+    def _save(self, connection, session_id: str, order: dict):
+        connection.execute(
+            "INSERT OR REPLACE INTO inprogress_orders (session_id, items, updated_at) "
+            "VALUES (?, ?, ?)",
+            (session_id, json.dumps(order), time.time()),
+        )
+        # Abandoned sessions are never read again, so they are swept here
+        if next(self._writes) % self.purge_every == 0:
+            self._purge(connection)
+
+    def _purge(self, connection) -> int:
+        cursor = connection.execute(
+            "DELETE FROM inprogress_orders WHERE updated_at < ?",
+            (time.time() - self.ttl,),
+        )
+        self.expired += cursor.rowcount
+        self.purges += 1
+        return cursor.rowcount
+
+    def get(self, session_id: str):
+        with self._connect() as connection:
+            return self._load(connection, session_id)
+
+    def add(self, session_id: str, food_dict: dict) -> dict:
+        with self._connect() as connection:
+            order = self._load(connection, session_id) or {}
+            order.update(food_dict)
+            self._save(connection, session_id, order)
+            return order
+
+    def remove(self, session_id: str, food_items: list):
+        with self._connect() as connection:
+            order = self._load(connection, session_id)
+            if order is None:
+                return None
+            removed, missing = _split_removal(order, food_items)
+            self._save(connection, session_id, order)
+            return removed, missing, order
+
+    def complete(self, session_id: str):
+        with self._connect() as connection:
+            order = self._load(connection, session_id)
+            if order is not None:
+                connection.execute(
+                    "DELETE FROM inprogress_orders WHERE session_id = ?", (session_id,)
+                )
+            return order
+
+    def purge_expired(self) -> int:
+        with self._connect() as connection:
+            return self._purge(connection)
+
+    def stats(self) -> dict:
+        with self._connect() as connection:
+            sessions = connection.execute(
+                "SELECT COUNT(*) FROM inprogress_orders"
+            ).fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "expired": self.expired,
+            "purges": self.purges,
+        }
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, making each
+    # read-modify-write atomic across processes sharing the file
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.connection.execute("COMMIT")
+        else:
+            self.connection.execute("ROLLBACK")
+        return False
+
+
+# Function to build the store selected by SESSION_STORE ("memory" or "sqlite")
+def create_session_store() -> SessionOrderStore:
+    backend = os.getenv("SESSION_STORE", "memory")
+    if backend == "sqlite":
+        return SQLiteSessionOrderStore(
+            os.getenv("SESSION_STORE_PATH", "/tmp/chatcuisine_sessions.db")
+        )
+    if backend == "memory":
+        return MemorySessionOrderStore()
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
@@ -0,0 +1,223 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped, gzip still works
+    brotli = None
+
+STATIC_DIR = "static"
+BUILD_DIR = os.path.join(STATIC_DIR, "build")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+
+# Cards show images 225px high, thumbnails are twice that for HiDPI screens
+THUMBNAIL_HEIGHT = 450
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+COMPRESSED_EXTENSIONS = (".css", ".js")
+
+# Fingerprinted build output never changes under the same name
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def _fingerprint(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:10]
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+# Function to copy a CSS/JS file to a content-hashed name, next to its
+# pre-compressed .gz (and .br when brotli is installed) variants
+def build_compressed_asset(relative_path: str) -> str:
+    with open(os.path.join(STATIC_DIR, relative_path), "rb") as file:
+        data = file.read()
+    stem, extension = os.path.splitext(relative_path)
+    built_path = f"{stem}.{_fingerprint(data)}{extension}"
+    target = os.path.join(BUILD_DIR, built_path)
+    _write(target, data)
+    _write(target + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(target + ".br", brotli.compress(data))
+    return "build/" + built_path
+
+
+# Function to write resized WebP (and AVIF, where Pillow supports it)
+# thumbnails of a food image. Returns {format: built path}.
+def build_thumbnails(relative_path: str) -> dict:
+    from PIL import Image, features
+
+    source = os.path.join(STATIC_DIR, relative_path)
+    with open(source, "rb") as file:
+        fingerprint = _fingerprint(file.read())
+    stem = os.path.splitext(relative_path)[0]
+
+    formats = {"webp": "WEBP"}
+    if features.check("avif"):
+        formats["avif"] = "AVIF"
+
+    thumbnails = {}
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        if image.height > THUMBNAIL_HEIGHT:
+            width = round(image.width * THUMBNAIL_HEIGHT / image.height)
+            image = image.resize((width, THUMBNAIL_HEIGHT), Image.LANCZOS)
+        for extension, image_format in formats.items():
+            built_path = f"{stem}.{fingerprint}.{extension}"
+            target = os.path.join(BUILD_DIR, built_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            image.save(target, image_format, quality=80)
+            thumbnails[extension] = "build/" + built_path
+    return thumbnails
+
+
+def load_manifest() -> dict:
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    with open(MANIFEST_PATH) as file:
+                        _manifest = json.load(file)
+                except (OSError, ValueError):
+                    _manifest = {"assets": {}, "thumbnails": {}}
+    return _manifest
+
+
+def _save_manifest(manifest: dict):
+    global _manifest
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    _manifest = manifest
+
+
+# Function to build every CSS/JS asset and image thumbnail under static/
+def build_all() -> dict:
+    manifest = {"assets": {}, "thumbnails": {}}
+    for directory, _, filenames in os.walk(STATIC_DIR):
+        if os.path.commonpath([directory, BUILD_DIR]) == BUILD_DIR:
+            continue
+        for filename in sorted(filenames):
+            relative_path = os.path.relpath(
+                os.path.join(directory, filename), STATIC_DIR
+            ).replace(os.sep, "/")
+            extension = os.path.splitext(filename)[1].lower()
+            if extension in COMPRESSED_EXTENSIONS:
+                manifest["assets"][relative_path] = build_compressed_asset(
+                    relative_path
+                )
+            elif extension in IMAGE_EXTENSIONS and relative_path.startswith("images/"):
+                manifest["thumbnails"][relative_path] = build_thumbnails(relative_path)
+    _save_manifest(manifest)
+    return manifest
+
+
+# Function to build thumbnails for one newly added food image, given its
+# /static/... URL. Missing files are skipped, the card keeps the original.
+def add_image(image_url: str):
+    relative_path = image_url.removeprefix("/static/")
+    if not os.path.isfile(os.path.join(STATIC_DIR, relative_path)):
+        return
+    try:
+        thumbnails = build_thumbnails(relative_path)
+        with _manifest_lock:
+            manifest = dict(load_manifest())
+            manifest["thumbnails"] = dict(manifest["thumbnails"])
+            manifest["thumbnails"][relative_path] = thumbnails
+            _save_manifest(manifest)
+    except Exception as e:
+        print(f"An error occurred while building thumbnails: {e}")
+
+
+# Jinja helpers: fingerprinted URL of an asset (falls back to the original
+# file when the build step hasn't run) and thumbnail URLs of a food image
+def asset_url(relative_path: str) -> str:
+    built_path = load_manifest()["assets"].get(relative_path, relative_path)
+    return f"/static/{built_path}"
+
+
+def thumbnail_urls(image_url) -> dict:
+    if not image_url:
+        return {}
+    thumbnails = load_manifest()["thumbnails"].get(
+        image_url.removeprefix("/static/"), {}
+    )
+    return {extension: f"/static/{path}" for extension, path in thumbnails.items()}
+
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+# Function to list the pre-compressed encodings an Accept-Encoding header
+# allows, most preferred first. A coding refused with q=0 (directly or
+# through "*") is never served.
+def accepted_encodings(accept_encoding: str) -> list:
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, parameters = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(";"):
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    ranked = []
+    for preference, encoding in enumerate(("br", "gzip")):
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > 0:
+            ranked.append((-quality, preference, encoding))
+    return [encoding for _, _, encoding in sorted(ranked)]
+
+
+# StaticFiles that serves build/ output with immutable caching and picks the
+# pre-compressed variant the client accepts
+class PrecompressedStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        is_build = path.startswith("build/")
+        if is_build and not path.endswith((".gz", ".br")):
+            accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+            full_path, _ = self.lookup_path(path)
+            for encoding in accepted_encodings(accept_encoding) if full_path else ():
+                compressed_path = full_path + ENCODING_SUFFIXES[encoding]
+                if os.path.isfile(compressed_path):
+                    media_type, _ = mimetypes.guess_type(path)
+                    return FileResponse(
+                        compressed_path,
+                        media_type=media_type,
+                        headers={
+                            "Content-Encoding": encoding,
+                            "Vary": "Accept-Encoding",
+                            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                        },
+                    )
+
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = (
+                IMMUTABLE_CACHE_CONTROL if is_build else STATIC_CACHE_CONTROL
+            )
+        if is_build:
+            # The same URL may be served compressed, caches must key on encoding
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
@@ -0,0 +1,76 @@
+import os
+import stat
+import time
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+import metrics
+
+TEMPLATES_DIR = "templates"
+# Compiled template bytecode, keyed by template name and source checksum so an
+# edited template never loads stale code. Every worker on the host shares it.
+# Unset, Jinja's per-user directory is used (created 0700 under the temp dir).
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or None
+# Stat template files on every render to pick up edits; turn off in production
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "1") == "1"
+
+
+# Cached bytecode is executed as-is, so a directory someone else can write to
+# would let them run code in the app. Refuses it rather than loading from it.
+def check_cache_dir(directory: str):
+    info = os.stat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError(f"Template cache {directory} is not a directory")
+    if hasattr(os, "getuid") and info.st_uid not in (os.getuid(), 0):
+        raise RuntimeError(f"Template cache {directory} belongs to another user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise RuntimeError(f"Template cache {directory} is group or world writable")
+
+
+# Bytecode cache that keeps serving templates when the cache directory can't
+# be written, e.g. one filled at build time and deployed read-only
+class SharedBytecodeCache(FileSystemBytecodeCache):
+    def __init__(self, directory=TEMPLATE_CACHE_DIR):
+        if directory is not None:
+            try:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            except OSError:
+                pass
+            check_cache_dir(directory)
+        super().__init__(directory)
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            print(f"Could not write template bytecode cache: {e}")
+
+
+# Template whose render time is added to the current request's metrics
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            metrics.record_render(time.perf_counter() - start)
+
+
+# Compiled code depends on environment options such as autoescape while cache
+# keys don't, so the app and the compile-templates command share this factory
+def create_environment(cache_dir=TEMPLATE_CACHE_DIR) -> Environment:
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        bytecode_cache=SharedBytecodeCache(cache_dir),
+        auto_reload=TEMPLATE_AUTO_RELOAD,
+    )
+    env.template_class = TimedTemplate
+    return env
+
+
+# Function to compile every template into the environment's in-memory cache,
+# which also writes its bytecode for the other workers. Returns the names.
+def precompile(env) -> list:
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return names
@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+# db_helper and main read their settings at import time, so the throwaway
+# SQLite database must be configured before any test module imports them
+TEST_DIR = tempfile.mkdtemp(prefix="chatcuisine-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(TEST_DIR, "test.db")
+os.environ.setdefault("SESSION_SECRET_KEY", "test")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture(scope="session")
+def database():
+    import db_helper
+
+    db_helper.init_db()
+    with db_helper.get_engine().begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO food_items (name, description, price, available) "
+                "VALUES ('Pav Bhaji', 'Spiced vegetable mash', 6, 1), "
+                "('Mango Lassi', 'Yogurt drink', 5, 1)"
+            )
+        )
+    return db_helper
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+def webhook_body(intent: str, parameters: dict, session_id="test-session"):
+    return {
+        "queryResult": {
+            "intent": {"displayName": intent},
+            "parameters": parameters,
+            "outputContexts": [
+                {"name": f"projects/p/agent/sessions/{session_id}/contexts/c"}
+            ],
+        }
+    }
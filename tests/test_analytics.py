@@ -0,0 +1,26 @@
+import asyncio
+from datetime import date
+import analytics
+import menu_cache
+
+
+def test_recorded_order_ids_stay_bounded(database):
+    model = analytics.AnalyticsModel(max_recorded=3)
+    order = {"Pav Bhaji": 2}
+
+    async def record_orders():
+        for _ in range(10):
+            order_id, _ = database.save_order(order)
+            model.record_order(order_id, order, menu_cache.catalog.lookup)
+            # Lets a catch-up that was just started run
+            await asyncio.sleep(0.01)
+
+    asyncio.run(record_orders())
+    assert len(model._recorded) <= 3
+
+    # Orders folded in by the catch-ups are not counted twice
+    reference = analytics.AnalyticsModel()
+    asyncio.run(reference.refresh())
+    today = date.today()
+    asyncio.run(model.refresh(force=True))
+    assert model.summary(today, today) == reference.summary(today, today)
@@ -0,0 +1,25 @@
+import generic_helper
+
+
+def test_extract_session_id_returns_the_id():
+    name = "projects/p/agent/sessions/abc-123/contexts/ongoing-order"
+    assert generic_helper.extract_session_id(name) == "abc-123"
+    assert generic_helper.extract_session_id("no session here") == ""
+
+
+def test_incremental_render_matches_full_render():
+    renderer = generic_helper.CartSummaryRenderer(max_sessions=2)
+    carts = [
+        {"Pav Bhaji": 2},
+        {"Pav Bhaji": 2, "Mango Lassi": 1.0},
+        {"Pav Bhaji": 3, "Mango Lassi": 1.0},
+        {"Pav Bhaji": 3, "Mango Lassi": 1.0},
+        {"Mango Lassi": 1.0, "Pav Bhaji": 3},
+        {"Mango Lassi": 1.0},
+    ]
+    for cart in carts:
+        expected = generic_helper.get_str_from_food_dict(cart)
+        assert renderer.render("s1", cart) == expected
+        # Other sessions evict s1 now and then, it must re-render from scratch
+        renderer.render("s2", {"Vada Pav": 1})
+        renderer.render("s3", {"Vada Pav": 1})
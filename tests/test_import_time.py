@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+# Cumulative `import main` time allowed, in ms. Raise it on slow CI machines
+# rather than dropping the check.
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+# Loaded on first use only: image processing, and the database drivers
+# (engines are created lazily)
+LAZY_MODULES = ["PIL", "aiosqlite", "aiomysql", "mysql.connector"]
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_main(*arguments):
+    return subprocess.run(
+        [sys.executable, *arguments],
+        cwd=REPO_DIR,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def main_import_ms() -> float:
+    stderr = import_main("-X", "importtime", "-c", "import main").stderr
+    for line in stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "main":
+            return int(fields[1]) / 1000
+    raise AssertionError("main missing from -X importtime output")
+
+
+def test_import_main_stays_within_budget():
+    # Best of three runs, so one noisy run doesn't fail the build
+    fastest = min(main_import_ms() for _ in range(3))
+    assert fastest <= IMPORT_TIME_BUDGET_MS, (
+        f"import main took {fastest:.0f} ms, budget {IMPORT_TIME_BUDGET_MS:.0f} ms"
+    )
+
+
+def test_import_main_does_no_io():
+    code = (
+        "import sys, db_helper, main; "
+        "print(db_helper._engine is None and db_helper._async_engine is None); "
+        f"print([name for name in {LAZY_MODULES!r} if name in sys.modules])"
+    )
+    engines_unused, loaded = import_main("-c", code).stdout.split("\n")[:2]
+    assert engines_unused == "True"
+    assert loaded == "[]"
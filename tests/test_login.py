@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+import password_helper
+
+
+def test_limiter_reserves_attempts():
+    limiter = password_helper.LoginRateLimiter(max_failures=3)
+    assert [limiter.allow("alok") for _ in range(5)] == [True] * 3 + [False] * 2
+    limiter.reset("alok")
+    assert limiter.allow("alok")
+
+
+def test_concurrent_bad_logins_are_capped(client, database, monkeypatch):
+    with database.get_engine().begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO users (username, email, full_name, hashed_password, "
+                "is_active, is_admin, token_version) "
+                "VALUES ('storm', 'storm@example.com', 'Storm', :password, 1, 0, 0)"
+            ),
+            {"password": password_helper.pwd_context.hash("right")},
+        )
+    verifies = []
+    verify = password_helper.verify_and_update
+
+    async def slow_verify(plain_password, hashed_password):
+        verifies.append(plain_password)
+        # Keeps every attempt in flight at once
+        await asyncio.sleep(0.2)
+        return await verify(plain_password, hashed_password)
+
+    monkeypatch.setattr(password_helper, "verify_and_update", slow_verify)
+
+    def attempt(_):
+        return client.post(
+            "/", data={"username": "storm", "password": "wrong"}, follow_redirects=False
+        ).status_code
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        statuses = list(executor.map(attempt, range(50)))
+
+    limit = password_helper.login_limiter.max_failures
+    assert len(verifies) == limit
+    assert statuses.count(429) == 50 - limit
@@ -0,0 +1,15 @@
+import asyncio
+import menu_cache
+
+
+def test_concurrent_reloads_query_once(database):
+    catalog = menu_cache.MenuCatalog()
+
+    async def load_many():
+        await asyncio.gather(*(catalog.ensure_loaded_async() for _ in range(50)))
+        catalog.invalidate()
+        await asyncio.gather(*(catalog.ensure_loaded_async() for _ in range(50)))
+
+    asyncio.run(load_many())
+    assert catalog.loads == 2
+    assert catalog.lookup("pav bhaji").price == 6
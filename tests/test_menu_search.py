@@ -0,0 +1,56 @@
+from menu_search import MenuSearchIndex
+
+MENU = [
+    "Pav Bhaji",
+    "Mango Lassi",
+    "Masala Dosa",
+    "Rava Dosa",
+    "Vada Pav",
+    "Vegetable Biryani",
+    "Chicken Biryani",
+]
+
+
+def build_index():
+    index = MenuSearchIndex()
+    index.rebuild(enumerate(MENU, 1))
+    return index
+
+
+def test_fuzzy_search_ranks_by_score_then_shorter_name():
+    index = build_index()
+    assert index.fuzzy_search("paav bhaji")[0] == (1, 0.818)
+    results = index.fuzzy_search("dosa", min_score=0.0)
+    # Both names contain "dosa", the shorter one ranks first
+    assert results[:2] == [(4, 0.8), (3, 0.8)]
+    assert [score for _, score in results] == sorted(
+        (score for _, score in results), reverse=True
+    )
+    assert index.fuzzy_search("dosa", limit=1, min_score=0.0) == results[:1]
+
+
+def test_best_matches_scores_every_query_in_one_call():
+    index = build_index()
+    assert index.best_matches(["paav bhaji", "masla dosa", "xyz"]) == [
+        (1, 0.818),
+        (3, 0.818),
+        (None, 0.0),
+    ]
+
+
+def test_short_and_partial_spoken_names_match():
+    index = build_index()
+    assert index.best_matches(["lasi", "biryni", "veg biryani"]) == [
+        (2, 0.6),
+        (7, 0.571),
+        (6, 0.833),
+    ]
+
+
+def test_edits_update_the_index():
+    index = build_index()
+    index.remove(1)
+    index.add(8, "Pav Bhaji Special")
+    assert index.best_matches(["pav bhaji"])[0][0] == 8
+    assert 1 not in dict(index.fuzzy_search("pav", min_score=0.0))
+    assert index.prefix_search("spec") == {8}
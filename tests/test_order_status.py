@@ -0,0 +1,17 @@
+import asyncio
+import order_status
+
+
+def test_repeated_status_reads_share_one_query(database):
+    order_id, _ = database.save_order({"Pav Bhaji": 1})
+    cache = order_status.OrderStatusCache(ttl=60)
+
+    async def read_many():
+        statuses = [await cache.get(order_id) for _ in range(100)]
+        statuses += (await cache.get_many([order_id, order_id + 10**6])).values()
+        return statuses
+
+    statuses = asyncio.run(read_many())
+    assert statuses[:101] == ["processing"] * 101
+    assert statuses[-1] is None
+    assert cache.stats()["queries"] == 2
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+
+
+def test_concurrent_orders_get_unique_ids(database):
+    order = {"Pav Bhaji": 2, "Mango Lassi": 1}
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(lambda _: database.save_order(order), range(500)))
+
+    order_ids = [order_id for order_id, _ in results]
+    assert -1 not in order_ids
+    assert len(set(order_ids)) == 500
+    assert {total for _, total in results} == {17.0}
+    with database.get_engine().connect() as connection:
+        lines = connection.execute(
+            text(
+                "SELECT COUNT(*) FROM order_items WHERE order_id IN "
+                f"({','.join(map(str, order_ids))})"
+            )
+        ).scalar()
+    assert lines == 1000
+
+
+def test_unknown_item_saves_nothing(database):
+    with database.get_engine().connect() as connection:
+        before = connection.execute(text("SELECT COUNT(*) FROM orders")).scalar()
+    assert database.save_order({"Pav Bhaji": 1, "Pizza": 1}) == (-1, None)
+    with database.get_engine().connect() as connection:
+        after = connection.execute(text("SELECT COUNT(*) FROM orders")).scalar()
+    assert after == before
@@ -0,0 +1,32 @@
+from sqlalchemy import text
+import recommendations
+
+
+def test_orders_recorded_during_a_rebuild_are_kept(database, monkeypatch):
+    with database.get_engine().connect() as connection:
+        rows = connection.execute(text("SELECT name, id FROM food_items"))
+        item_ids = {name: item_id for name, item_id in rows}
+    pav_bhaji, mango_lassi = item_ids["Pav Bhaji"], item_ids["Mango Lassi"]
+    for _ in range(3):
+        database.save_order({"Pav Bhaji": 1, "Mango Lassi": 1})
+    baseline = recommendations.CooccurrenceEngine()
+    baseline.rebuild()
+
+    engine = recommendations.CooccurrenceEngine()
+    order_pairs = recommendations.order_pairs
+    completed = []
+
+    # An order completes each time the rebuild counts a batch of history
+    def order_completes_mid_rebuild(order_ids, item_ids):
+        engine.record_order([pav_bhaji, mango_lassi])
+        completed.append(1)
+        return order_pairs(order_ids, item_ids)
+
+    monkeypatch.setattr(recommendations, "order_pairs", order_completes_mid_rebuild)
+    engine.rebuild(batch_size=2)
+
+    assert completed
+    expected = baseline._pairs[pav_bhaji][mango_lassi] + len(completed)
+    assert engine._pairs[pav_bhaji][mango_lassi] == expected
+    assert engine.stats() == baseline.stats()
+    assert engine.suggest([pav_bhaji]) == [mango_lassi]
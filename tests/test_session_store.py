@@ -0,0 +1,27 @@
+import os
+import time
+import pytest
+import session_store
+
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        session_store.SessionOrderStore()
+
+
+def test_sqlite_store_purges_abandoned_sessions(tmp_path):
+    store = session_store.SQLiteSessionOrderStore(
+        os.path.join(tmp_path, "sessions.db"), ttl=60, purge_every=10
+    )
+    store.add("abandoned", {"Pav Bhaji": 1})
+    with store._connect() as connection:
+        connection.execute(
+            "UPDATE inprogress_orders SET updated_at = ?", (time.time() - 120,)
+        )
+    for i in range(9):
+        store.add(f"live-{i}", {"Mango Lassi": 1})
+
+    stats = store.stats()
+    assert stats["sessions"] == 9
+    assert stats["expired"] == 1
+    assert stats["purges"] == 1
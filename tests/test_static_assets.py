@@ -0,0 +1,67 @@
+import gzip
+import os
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+import static_assets
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("", []),
+        ("gzip, deflate, br", ["br", "gzip"]),
+        ("br;q=0, gzip", ["gzip"]),
+        ("gzip;q=1.0, br;q=0.5", ["gzip", "br"]),
+        ("*", ["br", "gzip"]),
+        ("*;q=0.5, br;q=0", ["gzip"]),
+        ("identity", []),
+        ("BR; Q=0.8", ["br"]),
+    ],
+)
+def test_accepted_encodings(header, expected):
+    assert static_assets.accepted_encodings(header) == expected
+
+
+@pytest.fixture
+def static_client(tmp_path):
+    if static_assets.brotli is None:
+        pytest.skip("brotli is not installed")
+    os.makedirs(tmp_path / "build")
+    # The test client decodes what it receives, so the variants hold real
+    # compressed data with distinguishable contents
+    (tmp_path / "build" / "app.css").write_bytes(b"plain")
+    (tmp_path / "build" / "app.css.gz").write_bytes(gzip.compress(b"gz"))
+    (tmp_path / "build" / "app.css.br").write_bytes(
+        static_assets.brotli.compress(b"br")
+    )
+    app = Starlette(
+        routes=[
+            Mount(
+                "/static",
+                static_assets.PrecompressedStaticFiles(directory=str(tmp_path)),
+            )
+        ]
+    )
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, body, encoding",
+    [
+        ("br;q=0, gzip", b"gz", "gzip"),
+        ("gzip, br", b"br", "br"),
+        ("identity", b"plain", None),
+    ],
+)
+def test_build_files_honour_accept_encoding(
+    static_client, accept_encoding, body, encoding
+):
+    response = static_client.get(
+        "/static/build/app.css", headers={"Accept-Encoding": accept_encoding}
+    )
+    assert response.headers.get("content-encoding") == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "immutable" in response.headers["cache-control"]
+    assert response.content == body
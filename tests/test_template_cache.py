@@ -0,0 +1,25 @@
+import os
+import stat
+import pytest
+import template_cache
+
+
+def test_default_cache_dir_is_private_to_the_user():
+    cache = template_cache.SharedBytecodeCache(None)
+    info = os.stat(cache.directory)
+    assert info.st_uid == os.getuid()
+    assert stat.S_IMODE(info.st_mode) & 0o077 == 0
+
+
+def test_new_cache_dir_is_created_private(tmp_path):
+    directory = tmp_path / "jinja"
+    template_cache.SharedBytecodeCache(str(directory))
+    assert stat.S_IMODE(directory.stat().st_mode) & 0o077 == 0
+
+
+def test_writable_cache_dir_is_refused(tmp_path):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+    with pytest.raises(RuntimeError, match="writable"):
+        template_cache.SharedBytecodeCache(str(directory))
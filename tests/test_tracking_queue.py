@@ -0,0 +1,79 @@
+import asyncio
+from sqlalchemy.exc import OperationalError
+import db_helper
+import tracking_queue
+
+
+class SlowEngine:
+    def __init__(self, engine, delay):
+        self.engine = engine
+        self.delay = delay
+        self.dialect = engine.dialect
+
+    def begin(self):
+        engine, delay = self.engine, self.delay
+
+        class SlowBegin:
+            async def __aenter__(self):
+                await asyncio.sleep(delay)
+                self.context = engine.begin()
+                return await self.context.__aenter__()
+
+            async def __aexit__(self, *exc_info):
+                return await self.context.__aexit__(*exc_info)
+
+        return SlowBegin()
+
+
+def test_close_waits_for_the_in_flight_flush(database, monkeypatch):
+    order_id, _ = database.save_order({"Pav Bhaji": 1})
+    engine = SlowEngine(db_helper.get_async_engine(), delay=0.2)
+    monkeypatch.setattr(tracking_queue.db_helper, "get_async_engine", lambda: engine)
+    writer = tracking_queue.TrackingWriteBehind(flush_interval_ms=10)
+
+    async def update_then_close():
+        await writer.enqueue(order_id, "delivered")
+        # Let the background flush take the batch and start its slow write
+        await asyncio.sleep(0.05)
+        assert writer.stats()["pending"] == 0
+        await writer.close()
+
+    asyncio.run(update_then_close())
+    assert writer.stats()["flushed_rows"] == 1
+    assert writer.stats()["failed_rows"] == 0
+    assert database.get_order_status(order_id) == "delivered"
+
+
+class FlakyEngine:
+    def __init__(self, engine, failures):
+        self.engine = engine
+        self.failures = failures
+        self.dialect = engine.dialect
+
+    def begin(self):
+        if self.failures:
+            self.failures -= 1
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return self.engine.begin()
+
+
+def test_transient_failures_are_retried(database, monkeypatch):
+    order_id, _ = database.save_order({"Mango Lassi": 1})
+    engine = FlakyEngine(db_helper.get_async_engine(), failures=1)
+    monkeypatch.setattr(tracking_queue.db_helper, "get_async_engine", lambda: engine)
+    # Flushes only run when called below
+    writer = tracking_queue.TrackingWriteBehind(flush_interval_ms=60000)
+
+    async def update_with_a_lost_connection():
+        await writer.enqueue(order_id, "in-transit")
+        await writer.flush()
+        assert writer.stats()["pending"] == 1
+        await writer.flush()
+        await writer.close()
+
+    asyncio.run(update_with_a_lost_connection())
+    stats = writer.stats()
+    assert stats["requeued_rows"] == 1
+    assert stats["flushed_rows"] == 1
+    assert stats["failed_rows"] == 0
+    assert database.get_order_status(order_id) == "in-transit"
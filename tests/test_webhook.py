@@ -0,0 +1,97 @@
+import pytest
+from conftest import webhook_body
+
+ADD = "order.add - context: ongoing-order"
+UNCLEAR = (
+    "Sorry I didn't understand. Can you please specify food items and "
+    "quantities clearly?"
+)
+UNCLEAR_ORDER_ID = (
+    "Sorry I didn't understand. Can you please tell me your order id again?"
+)
+
+
+def reply(client, intent, parameters, session_id="test-session"):
+    response = client.post(
+        "/webhook", json=webhook_body(intent, parameters, session_id)
+    )
+    assert response.status_code == 200
+    return response.json()["fulfillmentText"]
+
+
+@pytest.mark.parametrize(
+    "intent, parameters",
+    [
+        (ADD, {}),
+        (ADD, {"food-item": ["Pav Bhaji"]}),
+        (ADD, {"food-item": ["Pav Bhaji"], "number": ["two"]}),
+        ("order.remove - context: ongoing-order", {"number": [1]}),
+    ],
+)
+def test_malformed_parameters_get_a_reply(client, intent, parameters):
+    assert reply(client, intent, parameters) == UNCLEAR
+
+
+def test_malformed_order_id_asks_for_the_order_id(client):
+    text = reply(client, "track.order - context: ongoing-tracking", {"number": "soon"})
+    assert text == UNCLEAR_ORDER_ID
+
+
+def test_order_round_trip(client):
+    text = reply(client, ADD, {"food-item": ["Pav Bhaji"], "number": [2.0]}, "trip")
+    assert text.startswith("So far you have: 2 Pav Bhaji.")
+    text = reply(client, "order.complete - context: ongoing-order", {}, "trip")
+    assert "Your total order amount is: 12.0" in text
+    order_id = int(text.split("order id is: ")[1].split(".")[0])
+    text = reply(
+        client, "track.order - context: ongoing-tracking", {"number": float(order_id)}
+    )
+    assert text.endswith("is: processing")
+
+
+def test_unknown_intent_gets_fallback(client):
+    assert reply(client, "weather.today", {"city": "Pune"}).startswith(
+        "Sorry, I didn't get that."
+    )
+
+
+def test_session_comes_from_the_request_without_contexts(client):
+    body = webhook_body(ADD, {"food-item": ["Mango Lassi"], "number": [1.0]})
+    body["queryResult"]["outputContexts"] = []
+    body["session"] = "projects/p/agent/sessions/no-contexts"
+    response = client.post("/webhook", json=body)
+    assert response.json()["fulfillmentText"].startswith("So far you have: 1 Mango")
+    text = reply(client, "order.complete - context: ongoing-order", {}, "no-contexts")
+    assert text.startswith("Order placed successfully!")
+
+    del body["session"]
+    assert client.post("/webhook", json=body).status_code == 400
+
+
+def test_invalid_json_is_rejected(client):
+    response = client.post("/webhook", content=b"{not json")
+    assert response.status_code == 400
+
+
+def test_unavailable_item_is_not_ordered(client, database):
+    import menu_cache
+    from sqlalchemy import text
+
+    with database.get_engine().begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO food_items (name, description, price, available) "
+                "VALUES ('Kulfi', 'Frozen dessert', 4, 0)"
+            )
+        )
+    menu_cache.catalog.invalidate()
+    reply(client, ADD, {"food-item": ["Kulfi"], "number": [1.0]}, "sold-out")
+    text = reply(client, "order.complete - context: ongoing-order", {}, "sold-out")
+    assert text.startswith("Sorry, Kulfi is not available right now.")
+    text = reply(
+        client,
+        "order.remove - context: ongoing-order",
+        {"food-item": ["Kulfi"]},
+        "sold-out",
+    )
+    assert text.endswith("Your order is empty!")
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+import db_helper
+from db_helper import OrderTracking
+
+# A flush runs every TRACKING_FLUSH_INTERVAL_MS, or as soon as this many
+# distinct orders are pending
+TRACKING_FLUSH_INTERVAL_MS = int(os.getenv("TRACKING_FLUSH_INTERVAL_MS", "200"))
+TRACKING_FLUSH_MAX_ROWS = int(os.getenv("TRACKING_FLUSH_MAX_ROWS", "500"))
+# Producers wait once this many orders are pending, until a flush drains them
+TRACKING_MAX_PENDING = int(os.getenv("TRACKING_MAX_PENDING", "10000"))
+
+
+def _upsert_statement(dialect_name: str):
+    table = OrderTracking.__table__
+    if dialect_name == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            status=statement.inserted.status, timestamp=statement.inserted.timestamp
+        )
+    if dialect_name == "sqlite":
+        statement = sqlite.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.order_id],
+            set_={
+                "status": statement.excluded.status,
+                "timestamp": statement.excluded.timestamp,
+            },
+        )
+    raise ValueError(f"No order_tracking upsert for dialect {dialect_name}")
+
+
+# Write-behind buffer for order_tracking. Updates are coalesced per order
+# (the last status wins) and written in batched upserts by a background task.
+class TrackingWriteBehind:
+    def __init__(
+        self,
+        flush_interval_ms=TRACKING_FLUSH_INTERVAL_MS,
+        flush_max_rows=TRACKING_FLUSH_MAX_ROWS,
+        max_pending=TRACKING_MAX_PENDING,
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_rows = flush_max_rows
+        self.max_pending = max_pending
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.requeued_rows = 0
+        self.backpressure_waits = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        # order_id -> (status, timestamp, monotonic time first queued)
+        self._pending = {}
+        self._task = None
+        self._wake = None
+        self._drained = None
+        self._stopping = False
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._drained = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, order_id: int, status: str):
+        self.start()
+        while len(self._pending) >= self.max_pending and order_id not in self._pending:
+            self.backpressure_waits += 1
+            self._wake.set()
+            self._drained.clear()
+            await self._drained.wait()
+
+        previous = self._pending.get(order_id)
+        if previous is not None:
+            self.coalesced += 1
+        queued_at = previous[2] if previous is not None else time.monotonic()
+        self._pending[order_id] = (status, datetime.now(), queued_at)
+        self.enqueued += 1
+        if len(self._pending) >= self.flush_max_rows:
+            self._wake.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            self._drained.set()
+            return
+        batch, self._pending = self._pending, {}
+        lag = time.monotonic() - min(entry[2] for entry in batch.values())
+        self.last_flush_lag = lag
+        self.max_flush_lag = max(self.max_flush_lag, lag)
+
+        rows = [
+            {"order_id": order_id, "status": status, "timestamp": timestamp}
+            for order_id, (status, timestamp, _) in batch.items()
+        ]
+        engine = db_helper.get_async_engine()
+        statement = _upsert_statement(engine.dialect.name)
+        # Orders written, or dropped for good, by this flush
+        done = set()
+        try:
+            try:
+                async with engine.begin() as connection:
+                    await connection.execute(statement, rows)
+                self.flushed_rows += len(rows)
+                done.update(batch)
+            except IntegrityError as e:
+                # One bad row (e.g. an unknown order id) must not sink the batch
+                print(f"An error occurred while flushing order tracking: {e}")
+                for row in rows:
+                    try:
+                        async with engine.begin() as connection:
+                            await connection.execute(statement, [row])
+                        self.flushed_rows += 1
+                    except IntegrityError as e:
+                        self.failed_rows += 1
+                        print(
+                            f"Dropped tracking update for order {row['order_id']}: {e}"
+                        )
+                    done.add(row["order_id"])
+        except asyncio.CancelledError:
+            self._requeue(batch, done)
+            raise
+        except Exception as e:
+            # A lost connection, lock wait or pool timeout passes: the statuses
+            # are already published to readers, so they must reach the table
+            print(f"Could not flush order tracking, will retry: {e}")
+            self._requeue(batch, done)
+        self.flushes += 1
+        self._drained.set()
+
+    # Hands unwritten rows back to the next flush. Updates queued meanwhile are
+    # newer and win.
+    def _requeue(self, batch, done):
+        for order_id, entry in batch.items():
+            if order_id not in done and order_id not in self._pending:
+                self._pending[order_id] = entry
+                self.requeued_rows += 1
+
+    # Stops the background task once its in-flight flush has finished, then
+    # writes out everything still pending
+    async def close(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        finally:
+            if self._pending:
+                self.failed_rows += len(self._pending)
+                print(f"Dropped {len(self._pending)} tracking updates on shutdown")
+                self._pending = {}
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "requeued_rows": self.requeued_rows,
+            "backpressure_waits": self.backpressure_waits,
+            "last_flush_lag_seconds": round(self.last_flush_lag, 4),
+            "max_flush_lag_seconds": round(self.max_flush_lag, 4),
+        }
+
+
+writer = TrackingWriteBehind()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from fastapi.responses import Response
+
+# Dialogflow retries a webhook call within seconds of a timeout; answers are
+# kept well past that so late retries still get the original reply
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "600"))
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+
+
+# Bounded TTL cache of webhook replies keyed on (session id, responseId).
+# A retry of a finished call gets the stored reply, a retry arriving while
+# the first call still runs waits for it, so the handler runs once either way.
+class WebhookDeduplicator:
+    def __init__(self, ttl=WEBHOOK_DEDUP_TTL, max_entries=WEBHOOK_DEDUP_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.executions = 0
+        self.replays = 0
+        self.coalesced = 0
+        # key -> (task returning (body, status, media_type), expires_at or
+        # None while in flight)
+        self._entries = OrderedDict()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        task, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        return entry
+
+    async def run(self, key, handle) -> Response:
+        entry = self._lookup(key)
+        if entry is not None:
+            task, expires_at = entry
+            if expires_at is None:
+                self.coalesced += 1
+            else:
+                self.replays += 1
+            return self._response(await asyncio.shield(task))
+
+        # The handler runs as its own task, so it still finishes (and its reply
+        # is kept for the retry) when Dialogflow gives up on the first call
+        task = asyncio.ensure_future(self._execute(key, handle))
+        self._entries[key] = (task, None)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.executions += 1
+        return self._response(await asyncio.shield(task))
+
+    async def _execute(self, key, handle):
+        try:
+            response = await handle()
+        except Exception:
+            # Failures aren't remembered, Dialogflow's retry runs again
+            if self._entries.get(key, (None,))[0] is asyncio.current_task():
+                del self._entries[key]
+            raise
+        if self._entries.get(key, (None,))[0] is asyncio.current_task():
+            self._entries[key] = (
+                asyncio.current_task(),
+                time.monotonic() + self.ttl,
+            )
+        return (response.body, response.status_code, response.media_type)
+
+    @staticmethod
+    def _response(result) -> Response:
+        body, status_code, media_type = result
+        return Response(content=body, status_code=status_code, media_type=media_type)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "executions": self.executions,
+            "replays": self.replays,
+            "coalesced": self.coalesced,
+        }
+
+
+deduplicator = WebhookDeduplicator()